@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -67,8 +68,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'store.debug.RequestLoggingMiddleware',
 ]
 
+# Sampled request logging; a zero sample rate removes the middleware entirely
+REQUEST_LOGGING = {
+    'SAMPLE_RATE': float(os.getenv('REQUEST_LOG_SAMPLE_RATE', 0)),
+    'ROUTES': [route for route in os.getenv('REQUEST_LOG_ROUTES', '/api/').split(',') if route],
+    'LOG_BODIES': os.getenv('REQUEST_LOG_BODIES') == 'true',
+    'MAX_BODY_BYTES': int(os.getenv('REQUEST_LOG_MAX_BODY_BYTES', 1024)),
+}
+
 ROOT_URLCONF = 'shoestore.urls'
 
 TEMPLATES = [
@@ -103,20 +113,76 @@ DATABASES = {
     'default': dj_database_url.config(
         default=db_url,
         conn_max_age=0,
-        ssl_require=True,
-        engine='django.db.backends.postgresql',
     )
 }
 
-# Ensure SSL and timeout options
-DATABASES['default']['OPTIONS'] = {
-    'sslmode': 'require',
-    'application_name': 'shoestore',
-    'connect_timeout': 10,
+# Ensure SSL and timeout options (a sqlite DATABASE_URL is used for local tests)
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['OPTIONS'] = {
+        'sslmode': 'require',
+        'application_name': 'shoestore',
+        'connect_timeout': 10,
+    }
+else:
+    # File-backed so concurrent test threads wait on locks instead of failing
+    DATABASES['default']['TEST'] = {
+        'NAME': os.path.join(tempfile.gettempdir(), 'shoestore_test.sqlite3'),
+    }
+
+# Connection lifetime depends on how the app is deployed:
+#   serverless - each invocation may be the last, so close connections after every request
+#   server     - long-lived gunicorn workers (Procfile) keep one connection per worker thread
+#                open for DB_CONN_MAX_AGE seconds, health-checked before reuse
+DEPLOYMENT_MODE = os.getenv('DEPLOYMENT_MODE', 'serverless')
+
+if DEPLOYMENT_MODE == 'server':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 600))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+else:
+    # Force immediate connection closure for serverless
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Optional read replica: catalog and order-history reads are routed to it
+# (store.views.mixins.ReplicaReadMixin); writes always go to the primary.
+# After a write the user reads from the primary for REPLICA_STICKY_SECONDS.
+if os.getenv('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.parse(os.getenv('REPLICA_DATABASE_URL'))
+    for option in ('OPTIONS', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS'):
+        if option in DATABASES['default'] and DATABASES['replica']['ENGINE'] == DATABASES['default']['ENGINE']:
+            DATABASES['replica'][option] = DATABASES['default'][option]
+    # Tests run the replica alias against the primary's test database
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['store.db_router.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+
+# Cache configuration: local memory by default, Redis when REDIS_URL is set
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
 }
 
-# Force immediate connection closure for serverless
-DATABASES['default']['CONN_MAX_AGE'] = 0
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
+# Seconds a cached catalog response lives; model signals invalidate it sooner
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+# In-process bitmap index for catalog filters (store/filter_index.py); off by
+# default, and turned off again if it would outgrow the memory limit
+CATALOG_FILTER_INDEX = os.getenv('CATALOG_FILTER_INDEX') == 'true'
+CATALOG_FILTER_INDEX_MAX_BYTES = int(os.getenv('CATALOG_FILTER_INDEX_MAX_BYTES', 64 * 1024 * 1024))
+
+# Background jobs (store/jobs.py, run by `manage.py run_worker`): seconds before
+# the first retry of a failed job, doubling per attempt, and the stock level
+# at which a reservation queues a low-stock alert
+JOB_RETRY_BACKOFF = int(os.getenv('JOB_RETRY_BACKOFF', 10))
+LOW_STOCK_THRESHOLD = int(os.getenv('LOW_STOCK_THRESHOLD', 2))
 
 
 # Password validation
@@ -226,6 +292,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # orjson-backed drop-ins for JSONRenderer/JSONParser with byte-identical output
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'store.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 12
 }
@@ -277,35 +353,31 @@ LOGGING = {
             'formatter': 'verbose',
         },
         'file': {
-            'class': 'logging.FileHandler',
+            # Creates the logs directory on first write, off the startup path
+            'class': 'store.log_handlers.LazyFileHandler',
             'filename': '/tmp/logs/django.log' if os.getenv('DJANGO_ENV') == 'production' else os.path.join(BASE_DIR, 'logs', 'django.log'),
             'formatter': 'verbose',
-        }
+            # Open the file on first write rather than during startup
+            'delay': True,
+        },
+        # Loggers only talk to the queue; a background thread feeds console and file
+        'queue': {
+            '()': 'store.log_handlers.QueueLogHandler',
+            'handlers': ['console', 'file'],
+            'maxsize': int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+            'overflow': os.getenv('LOG_QUEUE_OVERFLOW', 'drop_oldest'),
+        },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
             'propagate': True,
         },
         'store': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'handlers': ['queue'],
+            'level': os.getenv('STORE_LOG_LEVEL', 'INFO'),
             'propagate': True,
         },
     },
 }
-
-# Ensure logs directory exists
-if os.getenv('DJANGO_ENV') == 'production':
-    LOGS_DIR = '/tmp/logs'
-else:
-    LOGS_DIR = os.path.join(BASE_DIR, 'logs')
-
-if not os.path.exists(LOGS_DIR):
-    try:
-        os.makedirs(LOGS_DIR)
-    except OSError:
-        # If we can't create the directory, modify logging to use console only
-        LOGGING['loggers']['django']['handlers'] = ['console']
-        LOGGING['loggers']['store']['handlers'] = ['console']
@@ -6,3 +6,4 @@ class StoreConfig(AppConfig):
 
     def ready(self):
         import store.signals
+        import store.tasks
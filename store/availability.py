@@ -0,0 +1,71 @@
+"""
+Precomputed product availability.
+
+Each Product carries a summary of its Size rows: total stock, the in-stock
+sizes per gender and the smallest and largest in-stock size. It is
+refreshed whenever a size changes (ProductQuerySet.refresh_availability),
+so listings and "in stock in US 10" filters read one row per product
+instead of joining and aggregating sizes.
+
+In-stock sizes are stored as delimited `gender:size` tokens, e.g.
+`|M:US 9|M:US 10|W:US 7|`, which a substring match can test and which is
+backed by a pg_trgm index on Postgres (migration 0013).
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from django.db.models import Q
+
+SEPARATOR = '|'
+
+def normalize_size(size):
+    """'10' and 'US 10' both become 'US 10', matching Size.save()"""
+    size = size.strip()
+    return size if size.startswith('US ') else f'US {size}'
+
+def size_number(size):
+    """Numeric part of a size label, or None if it has none"""
+    match = re.search(r'\d+(?:\.\d+)?', size)
+    if not match:
+        return None
+    try:
+        return Decimal(match.group())
+    except InvalidOperation:
+        return None
+
+def size_token(gender, size):
+    return f'{gender}:{size}'
+
+def summarize(sizes):
+    """
+    Availability summary for one product's sizes, given as
+    (size, gender, quantity) tuples, as Product field values.
+    """
+    in_stock = sorted(
+        ((gender, size) for size, gender, quantity in sizes if quantity > 0),
+        key=lambda item: (item[0], size_number(item[1]) or 0, item[1]),
+    )
+    numbers = [number for number in (size_number(size) for _, size in in_stock) if number is not None]
+    return {
+        'total_stock': sum(max(quantity, 0) for _, _, quantity in sizes),
+        'in_stock_sizes': (
+            SEPARATOR + SEPARATOR.join(size_token(gender, size) for gender, size in in_stock) + SEPARATOR
+            if in_stock else ''
+        ),
+        'min_size': min(numbers, default=None),
+        'max_size': max(numbers, default=None),
+    }
+
+def in_stock_q(size, gender=None):
+    """Condition for products with `size` in stock, for one gender or any"""
+    size = normalize_size(size)
+    if gender:
+        return Q(in_stock_sizes__contains=f'{SEPARATOR}{size_token(gender, size)}{SEPARATOR}')
+    return Q(in_stock_sizes__contains=f':{size}{SEPARATOR}')
+
+def parse_in_stock_sizes(value):
+    """{gender: [size, ...]} from a stored in_stock_sizes value"""
+    sizes = {}
+    for token in filter(None, value.split(SEPARATOR)):
+        gender, _, size = token.partition(':')
+        sizes.setdefault(gender, []).append(size)
+    return sizes
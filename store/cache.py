@@ -0,0 +1,73 @@
+"""
+Versioned read-through cache for catalog responses.
+
+Every catalog model has a version counter in the cache. Response keys embed
+the current counters of the models they were built from, so bumping a
+counter orphans every cached page for that model at once; nothing is ever
+scanned or deleted and stale entries simply expire.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from store.db_router import reading_from_replica, replica_configured
+
+KEY_PREFIX = 'catalog'
+RECENT_CHANGE_KEY = f'{KEY_PREFIX}:changed-recently'
+
+def _version_key(model_name):
+    return f'{KEY_PREFIX}:version:{model_name}'
+
+def _fresh_version():
+    # Seeded from the clock so a counter lost to eviction never reuses an old value
+    return int(time.time() * 1000)
+
+def get_version(model_name):
+    """Return the current version counter for a catalog model"""
+    key = _version_key(model_name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), None)
+        version = cache.get(key)
+    return version
+
+def bump_version(model_name):
+    """Invalidate every cached response built from the given model and return its new version"""
+    key = _version_key(model_name)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        version = _fresh_version()
+        cache.set(key, version, None)
+    if replica_configured():
+        # The replica may not have this change yet; see replica_may_be_stale()
+        cache.set(RECENT_CHANGE_KEY, True, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+    return version
+
+def replica_may_be_stale():
+    """
+    Whether this request reads from a replica that may predate a catalog
+    change made within REPLICA_STICKY_SECONDS; such results must not be cached
+    """
+    return reading_from_replica() and cache.get(RECENT_CHANGE_KEY, False)
+
+def get_versions(model_names):
+    """Return the current version counters of several catalog models, as a tuple"""
+    versions = cache.get_many([_version_key(name) for name in model_names])
+    return tuple(versions.get(_version_key(name)) or get_version(name) for name in model_names)
+
+def response_key(model_names, request):
+    """Build the cache key for a request against the given catalog models"""
+    parts = [
+        f'{name}{version}' for name, version in zip(model_names, get_versions(model_names))
+    ]
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    # Pages carry absolute next/previous links, so the origin is part of the key
+    url = f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    digest = hashlib.md5(url.encode()).hexdigest()
+    return f'{KEY_PREFIX}:response:{":".join(parts)}:{digest}'
+
+def get_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
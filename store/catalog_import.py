@@ -0,0 +1,197 @@
+"""
+Bulk catalog import.
+
+Supplier feeds are read as a stream of records, validated and written in
+chunks: products are upserted on their SKU with one INSERT ... ON CONFLICT
+per chunk, and their sizes are matched on (product, gender, size) and
+updated or created in bulk. Each chunk commits on its own, so a run can be
+resumed from the last committed record.
+
+Input is NDJSON, one product per line in the shape written by
+export_catalog, or CSV with the columns
+
+    sku,name,description,brand,category,price,sizes
+
+where `sizes` lists `gender:size=quantity` entries separated by `;`,
+e.g. `M:US 9=5;W:US 7=2`.
+"""
+import csv
+import gzip
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from store import cache as catalog_cache
+from store.availability import normalize_size, summarize
+from store.models import Category, Product, Size
+
+# Columns overwritten when a SKU already exists
+PRODUCT_FIELDS = ['name', 'description', 'brand', 'category', 'price', 'updated_at']
+UPDATE_BATCH_SIZE = 900
+GENDERS = {choice for choice, _ in Size.GENDER_CHOICES}
+# Product.price holds max_digits=10 with two decimal places
+MAX_PRICE = Decimal(10) ** 8
+
+class InvalidRecord(ValueError):
+    pass
+
+def open_feed(path):
+    """Open a feed as text; .gz files are decompressed on the fly"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return io.open(path, 'r', encoding='utf-8', newline='')
+
+def feed_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+def read_records(stream, fmt):
+    """Yield raw records as dicts, one per product"""
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            row['sizes'] = _parse_csv_sizes(row.get('sizes') or '')
+            yield row
+        return
+    for line in stream:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Rejected by clean_record, so one bad line does not stop the import
+                yield None
+
+def _parse_csv_sizes(value):
+    sizes = []
+    for entry in filter(None, (part.strip() for part in value.split(';'))):
+        label, _, quantity = entry.rpartition('=')
+        gender, _, size = label.partition(':')
+        sizes.append({'gender': gender, 'size': size, 'quantity': quantity})
+    return sizes
+
+def clean_record(record):
+    """Validate one raw record, returning (product fields, sizes) or raising InvalidRecord"""
+    if not isinstance(record, dict):
+        raise InvalidRecord('not a JSON object')
+    sku = str(record.get('sku') or '').strip()
+    name = str(record.get('name') or '').strip()
+    if not sku:
+        raise InvalidRecord('sku is required')
+    if len(sku) > 50:
+        raise InvalidRecord('sku is longer than 50 characters')
+    if not name:
+        raise InvalidRecord('name is required')
+    try:
+        price = Decimal(str(record.get('price')))
+        if not price.is_finite():
+            raise ValueError
+        price = price.quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise InvalidRecord(f'invalid price {record.get("price")!r}')
+    if price < 0:
+        raise InvalidRecord('price must not be negative')
+    if price >= MAX_PRICE:
+        raise InvalidRecord(f'price must be below {MAX_PRICE}')
+
+    entries = record.get('sizes') or []
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        raise InvalidRecord('sizes must be a list of objects')
+    sizes = {}
+    for entry in entries:
+        gender = str(entry.get('gender', '')).strip().upper()
+        if gender not in GENDERS:
+            raise InvalidRecord(f'invalid gender {entry.get("gender")!r}')
+        try:
+            quantity = int(entry.get('quantity', 0))
+        except (TypeError, ValueError):
+            raise InvalidRecord(f'invalid quantity {entry.get("quantity")!r}')
+        if quantity < 0:
+            raise InvalidRecord('quantity must not be negative')
+        size = normalize_size(str(entry.get('size', '')))
+        if size == 'US ' or len(size) > 10:
+            raise InvalidRecord(f'invalid size {entry.get("size")!r}')
+        sizes[(gender, size)] = quantity
+
+    fields = {
+        'sku': sku,
+        'name': name[:200],
+        'description': str(record.get('description') or ''),
+        'brand': str(record.get('brand') or '')[:100],
+        'category': str(record.get('category') or '').strip() or None,
+        'price': price,
+    }
+    return fields, sizes
+
+class CatalogImporter:
+    """
+    Upsert validated records chunk by chunk.
+
+    `import_chunk` takes [(product fields, sizes)] and commits them in one
+    transaction; `finish` invalidates the catalog caches once at the end.
+    """
+
+    def __init__(self):
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+
+    def category_ids(self, names):
+        missing = {name for name in names if name and name not in self.categories}
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in sorted(missing)])
+            self.categories.update(
+                Category.objects.filter(name__in=missing).values_list('name', 'pk')
+            )
+        return self.categories
+
+    @transaction.atomic
+    def import_chunk(self, records):
+        # A SKU repeated within a chunk keeps its last record
+        records = {fields['sku']: (fields, sizes) for fields, sizes in records}
+        categories = self.category_ids(fields['category'] for fields, _ in records.values())
+
+        # Sizes already stored for these SKUs: {sku: {(gender, size): (pk, quantity)}}
+        existing = {}
+        for pk, sku, gender, size, quantity in Size.objects.filter(product__sku__in=records).values_list(
+            'pk', 'product__sku', 'gender', 'size', 'quantity'
+        ):
+            existing.setdefault(sku, {})[(gender, size)] = (pk, quantity)
+
+        # The availability summary is computed here and written by the upsert
+        # itself, rather than refreshed row by row afterwards
+        products = []
+        for sku, (fields, sizes) in records.items():
+            stock = {key: quantity for key, (_, quantity) in existing.get(sku, {}).items()}
+            stock.update(sizes)
+            products.append(Product(
+                sku=sku, name=fields['name'], description=fields['description'],
+                brand=fields['brand'], price=fields['price'],
+                category_id=categories.get(fields['category']),
+                **summarize([(size, gender, quantity) for (gender, size), quantity in stock.items()]),
+            ))
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=PRODUCT_FIELDS + Product.AVAILABILITY_FIELDS,
+        )
+        product_ids = dict(Product.objects.filter(sku__in=records).values_list('sku', 'pk'))
+
+        creates, changed = [], {}
+        for sku, (_, sizes) in records.items():
+            for (gender, size), quantity in sizes.items():
+                current = existing.get(sku, {}).get((gender, size))
+                if current is None:
+                    creates.append(
+                        Size(product_id=product_ids[sku], gender=gender, size=size, quantity=quantity)
+                    )
+                elif current[1] != quantity:
+                    changed.setdefault(quantity, []).append(current[0])
+        Size.objects.bulk_create(creates)
+        # One UPDATE per distinct new quantity; far cheaper than a CASE per row
+        for quantity, pks in changed.items():
+            for start in range(0, len(pks), UPDATE_BATCH_SIZE):
+                Size.objects.filter(pk__in=pks[start:start + UPDATE_BATCH_SIZE]).update(quantity=quantity)
+        return len(records)
+
+    def finish(self):
+        for model_name in ('product', 'size', 'category'):
+            catalog_cache.bump_version(model_name)
@@ -0,0 +1,67 @@
+"""
+Primary/replica database routing.
+
+When a `replica` database is configured, reads made while replica reads are
+enabled (see ReplicaReadMixin) go to the replica; everything else, and every
+write, goes to `default`. A user who has just written is pinned to the
+primary for REPLICA_STICKY_SECONDS so they always read their own writes.
+
+Cached catalog responses are shared by every user, so for the same window
+after any catalog change, responses read from the replica are not cached
+(see store.cache.replica_may_be_stale): otherwise a lagging replica could
+fill the new version's keys with stale rows that pinned users are then
+served.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_ALIAS = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+def reading_from_replica():
+    """Whether reads in the current context are routed to the replica"""
+    return _replica_reads.get() and replica_configured()
+
+@contextmanager
+def replica_reads():
+    """Send reads inside the block to the replica"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+def _pin_key(user):
+    return f'replica:pinned:{user.pk}'
+
+def pin_to_primary(user):
+    """Route this user's reads to the primary until their write has replicated"""
+    if user.is_authenticated and replica_configured():
+        cache.set(_pin_key(user), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+def is_pinned_to_primary(user):
+    # Without a replica every read is on the primary; skip the cache round trip
+    if not replica_configured() or not user.is_authenticated:
+        return False
+    return cache.get(_pin_key(user), False)
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicit, otherwise Django would save rows back to the alias they were read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
@@ -1,120 +1,122 @@
 import logging
 import json
-import traceback
+import random
+import time
 from datetime import datetime
+from django.core.exceptions import MiddlewareNotUsed
 from django.http import JsonResponse
 from rest_framework import status
 from django.conf import settings
 
-# Define log directory
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
-
-# Configure logging
+# Handlers and levels come from settings.LOGGING
 logger = logging.getLogger('store')
-logger.setLevel(logging.DEBUG)
+request_logger = logging.getLogger('store.requests')
+
+REQUEST_LOGGING_DEFAULTS = {
+    'SAMPLE_RATE': 0.0,
+    'ROUTES': [],
+    'LOG_BODIES': False,
+    'MAX_BODY_BYTES': 1024,
+}
+
+class LazyJSON:
+    """Defer json.dumps until a log record is actually formatted"""
+
+    def __init__(self, data):
+        self.data = data
 
-# Create console handler
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
+    def __str__(self):
+        return json.dumps(self.data, default=str)
 
-# Create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-ch.setFormatter(formatter)
+class TruncatedBody:
+    """Defer decoding of a request or response body, keeping at most `limit` bytes"""
 
-# Add handlers to logger
-logger.addHandler(ch)
+    def __init__(self, body, limit):
+        self.size = len(body)
+        self.body = body[:limit]
+
+    def __str__(self):
+        text = self.body.decode('utf-8', errors='replace')
+        if self.size > len(self.body):
+            text = f'{text}... [{self.size - len(self.body)} more bytes]'
+        return text
 
 def log_debug(message, extra=None):
     """Log debug message with optional extra data"""
     if extra:
-        message = f"{message} - Extra: {json.dumps(extra)}"
-    logger.debug(message)
+        logger.debug('%s - Extra: %s', message, LazyJSON(extra))
+    else:
+        logger.debug(message)
 
 def log_error(message, exc=None, extra=None):
     """Log error message with optional exception and extra data"""
-    if exc:
-        tb = ''.join(traceback.format_tb(exc.__traceback__))
-        message = f"{message}\nException: {str(exc)}\nTraceback:\n{tb}"
     if extra:
-        message = f"{message}\nExtra: {json.dumps(extra)}"
-    logger.error(message)
+        logger.error('%s\nExtra: %s', message, LazyJSON(extra), exc_info=exc)
+    else:
+        logger.error(message, exc_info=exc)
+
+class RequestLoggingMiddleware:
+    """
+    Sampled, size-capped request logging.
+
+    Configured through settings.REQUEST_LOGGING:
+        SAMPLE_RATE     fraction of requests to log (0 removes the middleware)
+        ROUTES          path prefixes to log; empty means every path
+        LOG_BODIES      include request and response bodies
+        MAX_BODY_BYTES  bodies are truncated to this many bytes
+
+    Each sampled request produces one INFO record on the `store.requests`
+    logger whose message is its fields as JSON, so the plain formatters in
+    settings.LOGGING show them; they are also passed as `extra` for
+    structured formatters. The JSON, bodies included, is only built if a
+    handler formats the record.
+    """
 
-class APIDebugMiddleware:
     def __init__(self, get_response):
+        config = {**REQUEST_LOGGING_DEFAULTS, **getattr(settings, 'REQUEST_LOGGING', {})}
+        self.sample_rate = float(config['SAMPLE_RATE'])
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.routes = tuple(config['ROUTES'])
+        self.log_bodies = config['LOG_BODIES']
+        self.max_body_bytes = config['MAX_BODY_BYTES']
         self.get_response = get_response
 
     def __call__(self, request):
-        # Log request
-        self._log_request(request)
-        
-        try:
-            response = self.get_response(request)
-            # Log response
-            self._log_response(request, response)
-            return response
-        except Exception as e:
-            # Log error
-            log_error("An error occurred", e)
-            return self.handle_error(e)
-
-    def _log_request(self, request):
-        """Log incoming request details"""
-        headers = dict(request.headers)
-        # Remove sensitive information
-        if 'Authorization' in headers:
-            headers['Authorization'] = '[FILTERED]'
-        
-        body = None
-        if request.body:
-            try:
-                body = json.loads(request.body)
-            except json.JSONDecodeError:
-                body = "Could not parse request body"
-        
-        log_debug(
-            f"\nREQUEST: {request.method} {request.path}",
-            {
-                "headers": headers,
-                "query_params": dict(request.GET),
-                "body": body
-            }
-        )
-
-    def _log_response(self, request, response):
-        """Log outgoing response details"""
-        content = None
-        if hasattr(response, 'content'):
-            try:
-                content = response.content.decode('utf-8')
-            except:
-                content = "[Binary content]"
-        
-        log_debug(
-            f"\nRESPONSE: {request.method} {request.path}",
-            {
-                "status": response.status_code,
-                "content": content
-            }
-        )
-
-    def handle_error(self, exception):
-        error_response = {
-            'error': {
-                'type': type(exception).__name__,
-                'message': str(exception),
-                'timestamp': datetime.now().isoformat()
-            }
+        if not self._should_log(request):
+            return self.get_response(request)
+
+        request_body = None
+        if self.log_bodies and not request.content_type.startswith('multipart/'):
+            # Read before the view so the body is cached for it; uploads are skipped
+            request_body = TruncatedBody(request.body, self.max_body_bytes)
+
+        start = time.monotonic()
+        response = self.get_response(request)
+        duration_ms = (time.monotonic() - start) * 1000
+
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'query': request.META.get('QUERY_STRING', ''),
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 1),
+            'user_id': getattr(getattr(request, 'user', None), 'pk', None),
         }
-        
-        if settings.DEBUG:
-            error_response['error']['traceback'] = traceback.format_exc()
-        
-        return JsonResponse(
-            error_response,
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+        if self.log_bodies:
+            fields['request_body'] = request_body
+            if not response.streaming:
+                fields['response_body'] = TruncatedBody(response.content, self.max_body_bytes)
+
+        request_logger.info('%s', LazyJSON(fields), extra={'request_log': fields})
+        return response
+
+    def _should_log(self, request):
+        if not request_logger.isEnabledFor(logging.INFO):
+            return False
+        if self.routes and not request.path.startswith(self.routes):
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
 
 def api_error_response(message, status_code=status.HTTP_400_BAD_REQUEST, extra=None):
     """Utility function to return consistent error responses"""
@@ -124,14 +126,14 @@ def api_error_response(message, status_code=status.HTTP_400_BAD_REQUEST, extra=N
             'timestamp': datetime.now().isoformat()
         }
     }
-    
+
     if extra:
         response['error'].update(extra)
-    
+
     if settings.DEBUG:
         response['error']['debug_info'] = {
             'status_code': status_code,
             'extra': extra
         }
-    
+
     return JsonResponse(response, status=status_code)
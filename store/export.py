@@ -0,0 +1,82 @@
+"""
+Streaming catalog export.
+
+The catalog is written as NDJSON, one product per line with its sizes
+nested, for the downstream search and ads feeds. Products are read in
+chunks through a server-side cursor (QuerySet.iterator) with their sizes
+prefetched per chunk, and output is produced chunk by chunk, optionally
+gzip-compressed, so memory use stays flat however large the catalog is.
+"""
+import zlib
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch
+from store.models import Product, Size
+
+DEFAULT_CHUNK_SIZE = 2000
+# Lines are joined into writes of about this many bytes
+WRITE_BUFFER_BYTES = 64 * 1024
+
+def product_record(product):
+    """The exported form of one product; expects sizes to be prefetched"""
+    return {
+        'id': product.pk,
+        'sku': product.sku,
+        'name': product.name,
+        'brand': product.brand,
+        'description': product.description,
+        'category': product.category.name if product.category_id else None,
+        'price': product.price,
+        'rating': product.rating,
+        'review_count': product.review_count,
+        'image': product.image.name or None,
+        'total_stock': product.total_stock,
+        'sizes': [
+            {'size': size.size, 'gender': size.gender, 'quantity': size.quantity}
+            for size in product.sizes.all()
+        ],
+        'updated_at': product.updated_at,
+    }
+
+def iter_catalog(chunk_size=DEFAULT_CHUNK_SIZE, using=None):
+    """Yield every product as an export record, in primary key order"""
+    queryset = Product.objects.select_related('category').prefetch_related(
+        Prefetch('sizes', queryset=Size.objects.order_by('gender', 'size'))
+    ).order_by('pk')
+    if using:
+        queryset = queryset.using(using)
+    # The cursor must live in one transaction when connections go through a
+    # transaction-mode pooler; it also gives the export a consistent snapshot
+    with transaction.atomic(using=queryset.db):
+        for product in queryset.iterator(chunk_size=chunk_size):
+            yield product_record(product)
+
+def iter_ndjson(records):
+    """Encode records as NDJSON, yielding bytes in buffered writes"""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    buffer = []
+    size = 0
+    for record in records:
+        line = (encoder.encode(record) + '\n').encode()
+        buffer.append(line)
+        size += len(line)
+        if size >= WRITE_BUFFER_BYTES:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+def iter_gzip(chunks, level=6):
+    """Gzip a stream of byte chunks incrementally"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def iter_export(gzip=False, chunk_size=DEFAULT_CHUNK_SIZE, using=None):
+    """The whole catalog as NDJSON bytes, gzipped if asked"""
+    chunks = iter_ndjson(iter_catalog(chunk_size, using))
+    return iter_gzip(chunks) if gzip else chunks
@@ -0,0 +1,197 @@
+"""
+Catalog filters and facet counts.
+
+CatalogFilter narrows product lists by `?category=` and `?brand=` (both
+repeatable), `?min_price=`, `?max_price=`, `?min_rating=`, and
+`?in_stock_size=` and `?gender=` (either or both). facet_counts() returns,
+for the same filter set, the number of matching products per category,
+brand, in-stock size and price band, for the storefront's filter sidebar.
+
+All facets come back from one query: each facet is a grouped aggregate and
+the aggregates are combined with UNION ALL. Each facet's counts ignore that
+facet's own filter, so with one brand selected the sidebar still shows how
+many products every other brand would add.
+"""
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from django.db.models.functions import Cast
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from store import filter_index
+from store.availability import SEPARATOR, in_stock_q, normalize_size, size_number
+from store.models import Category, Size
+
+FACETS = ('category', 'brand', 'size', 'price')
+# Upper bounds of the price bands; the last band is open-ended
+DEFAULT_PRICE_BANDS = (50, 100, 150, 200)
+
+def price_bands():
+    """[(key, lower, upper)] with lower <= price < upper; upper is None for the last band"""
+    bounds = list(getattr(settings, 'CATALOG_PRICE_BANDS', DEFAULT_PRICE_BANDS))
+    lowers = [0] + bounds
+    uppers = bounds + [None]
+    return [
+        (f'{lower}-{upper}' if upper is not None else f'{lower}+', lower, upper)
+        for lower, upper in zip(lowers, uppers)
+    ]
+
+def _number(params, name):
+    value = params.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'A valid number is required.'})
+    if not number.is_finite():
+        raise ValidationError({name: 'A valid number is required.'})
+    return number
+
+def parse_filters(params):
+    """
+    The catalog filters in the query parameters, as a dict with any of
+        'category'  [category id, ...]
+        'brand'     [brand, ...], matched case-insensitively
+        'size'      (size or None, gender or None), in stock
+        'price'     (min or None, max or None), inclusive
+        'rating'    minimum rating
+    """
+    spec = {}
+    categories = [value for value in params.getlist('category') if value]
+    if categories:
+        low, high = connection.ops.integer_field_ranges[Category._meta.pk.get_internal_type()]
+        try:
+            spec['category'] = [int(value) for value in categories]
+        except ValueError:
+            raise ValidationError({'category': 'Category ids must be integers.'})
+        # Ids the column cannot hold would overflow in the query rather than match nothing
+        if not all(low <= pk <= high for pk in spec['category']):
+            raise ValidationError({'category': 'Category ids must be integers.'})
+
+    brands = [value.strip() for value in params.getlist('brand') if value.strip()]
+    if brands:
+        spec['brand'] = brands
+
+    size = params.get('in_stock_size', '').strip() or None
+    gender = params.get('gender', '').strip().upper() or None
+    if size or gender:
+        spec['size'] = (normalize_size(size) if size else None, gender)
+
+    min_price, max_price = _number(params, 'min_price'), _number(params, 'max_price')
+    if min_price is not None or max_price is not None:
+        spec['price'] = (min_price, max_price)
+
+    min_rating = _number(params, 'min_rating')
+    if min_rating is not None:
+        spec['rating'] = min_rating
+    return spec
+
+def filter_conditions(spec):
+    """{facet: Q} for a parse_filters() result"""
+    conditions = {}
+    if 'category' in spec:
+        conditions['category'] = Q(category_id__in=spec['category'])
+    if 'brand' in spec:
+        condition = Q()
+        for brand in spec['brand']:
+            condition |= Q(brand__iexact=brand)
+        conditions['brand'] = condition
+    if 'size' in spec:
+        size, gender = spec['size']
+        conditions['size'] = (
+            in_stock_q(size, gender) if size
+            else Q(in_stock_sizes__contains=f'{SEPARATOR}{gender}:')
+        )
+    if 'price' in spec:
+        min_price, max_price = spec['price']
+        condition = Q()
+        if min_price is not None:
+            condition &= Q(price__gte=min_price)
+        if max_price is not None:
+            condition &= Q(price__lte=max_price)
+        conditions['price'] = condition
+    if 'rating' in spec:
+        conditions['rating'] = Q(rating__gte=spec['rating'])
+    return conditions
+
+class CatalogFilter(BaseFilterBackend):
+    """Apply the category, brand, price, rating and in-stock size filters"""
+
+    def filter_queryset(self, request, queryset, view):
+        spec = parse_filters(request.query_params)
+        ids = filter_index.match(spec) if spec else None
+        if ids is not None:
+            # Matched in memory (CATALOG_FILTER_INDEX); the page is loaded by id
+            return queryset.filter(pk__in=ids)
+        for condition in filter_conditions(spec).values():
+            queryset = queryset.filter(condition)
+        return queryset
+
+def _grouped(queryset, facet, key, label, count='pk'):
+    # Compound statements allow no ORDER BY in their parts
+    return queryset.order_by().values(
+        facet=Value(facet, output_field=CharField()),
+        key=Cast(key, CharField()),
+        label=Cast(label, CharField()),
+    ).annotate(count=Count(count, distinct=count != 'pk'))
+
+def facet_queryset(queryset, filters, gender=None):
+    """
+    One UNION ALL query of (facet, key, label, count) rows over the products
+    in `queryset`, plus a ('total', '', '', count) row for the full filter set
+    """
+    def narrowed(excluding=None):
+        products = queryset
+        for facet, condition in filters.items():
+            if facet != excluding:
+                products = products.filter(condition)
+        return products
+
+    band = Case(
+        *[When(price__lt=upper, then=Value(key)) for key, _, upper in price_bands() if upper is not None],
+        default=Value(price_bands()[-1][0]),
+        output_field=CharField(),
+    )
+    sizes = Size.objects.filter(quantity__gt=0, product__in=narrowed('size').values('pk'))
+    if gender:
+        sizes = sizes.filter(gender=gender)
+
+    parts = [
+        _grouped(narrowed(), 'total', Value(''), Value('')),
+        _grouped(narrowed('category'), 'category', 'category_id', 'category__name'),
+        _grouped(narrowed('brand'), 'brand', 'brand', 'brand'),
+        _grouped(sizes, 'size', 'size', 'size', count='product_id'),
+        _grouped(narrowed('price').annotate(band=band), 'price', F('band'), F('band')),
+    ]
+    return parts[0].union(*parts[1:], all=True)
+
+def facet_counts(queryset, params):
+    """
+    Facet counts for the products in `queryset` under the filters in
+    `params`, as {'count': total, 'facets': {facet: [entry, ...]}}
+    """
+    spec = parse_filters(params)
+    rows = facet_queryset(queryset, filter_conditions(spec), spec.get('size', (None, None))[1])
+    facets = {facet: [] for facet in FACETS}
+    bands = {key: (lower, upper) for key, lower, upper in price_bands()}
+    total = 0
+    for row in rows:
+        if row['facet'] == 'total':
+            total = row['count']
+        elif row['key']:
+            entry = {'value': row['key'], 'label': row['label'], 'count': row['count']}
+            if row['facet'] == 'category':
+                entry['value'] = int(entry['value'])
+            elif row['facet'] == 'price':
+                lower, upper = bands[row['key']]
+                entry.update(min_price=lower, max_price=upper)
+            facets[row['facet']].append(entry)
+
+    facets['category'].sort(key=lambda entry: (-entry['count'], entry['label']))
+    facets['brand'].sort(key=lambda entry: (-entry['count'], entry['label'].lower()))
+    facets['size'].sort(key=lambda entry: (size_number(entry['value']) or 0, entry['value']))
+    order = list(bands)
+    facets['price'].sort(key=lambda entry: order.index(entry['value']))
+    return {'count': total, 'facets': facets}
@@ -0,0 +1,462 @@
+"""
+In-process bitmap index for catalog filters.
+
+Enabled with CATALOG_FILTER_INDEX. Every category, brand, in-stock size
+and gender maps to a bitset of the ids of the products that have it, held
+as a Python int with bit `id` set. Prices and ratings are split into
+buckets of about the same number of products, with one bitset per bucket.
+A combination of filters is answered with a few big-integer ORs and ANDs,
+and the matching page is then loaded with one `id__in` query. Sizes come
+from the availability summary, so the index is built from a single scan of
+the product table.
+
+Each process builds the index on first use and keeps it current: model
+signals, stock reservations and ratings queue the products they change,
+which are reloaded when the transaction commits. They also publish the
+changed ids in the shared cache under the catalog version they bumped, so
+other processes see versions they did not bump and reload just those
+products on their next query. Changes nobody published (bulk imports,
+category deletes, expired entries) make the next query rebuild the index.
+
+A bitset takes one bit per product id up to the highest id it holds. If a
+build would need more than CATALOG_FILTER_INDEX_MAX_BYTES, the index
+switches itself off for the life of the process and filtering goes back to
+SQL; stats() and the bench_filter_index command report its size.
+"""
+import functools
+import logging
+import math
+import sys
+import threading
+from bisect import bisect_left, bisect_right, insort
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from store import cache as catalog_cache
+from store.availability import SEPARATOR
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('pk', 'category_id', 'brand', 'price', 'rating', 'in_stock_sizes')
+VERSION_MODELS = ('product', 'size', 'category')
+# Attributes queried by range rather than by exact value, and their bucket count
+RANGE_ATTRIBUTES = ('price', 'rating')
+RANGE_BUCKETS = 64
+# A (value, id) tuple and its list slot
+ENTRY_BYTES = 64
+ROW_BYTES = sys.getsizeof((0, '', Decimal(0), Decimal(0), '')) + 2 * sys.getsizeof(Decimal('100.00'))
+# Larger matches are left to SQL rather than sent back as an id list
+MAX_MATCHED_IDS = 10000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Falling further behind than this many versions of a model rebuilds the index
+MAX_CATCH_UP = 100
+
+@functools.lru_cache(maxsize=4096)
+def _size_keys(in_stock_sizes):
+    # Many products share the same run of sizes
+    keys = set()
+    for token in in_stock_sizes.split(SEPARATOR):
+        if token:
+            gender, _, size = token.partition(':')
+            keys.update((('gender_size', token), ('size', size), ('gender', gender)))
+    return frozenset(keys)
+
+def product_keys(category_id, brand, in_stock_sizes):
+    """The (attribute, value) keys one product is indexed under, besides its price and rating"""
+    return _size_keys(in_stock_sizes) | {('category', category_id), ('brand', brand)}
+
+def bitset(ids):
+    """An int with the bit of every id set"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        buffer[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(buffer, 'little')
+
+def bitset_ids(bits):
+    """The ids set in `bits`, in ascending order"""
+    digits = bin(bits)[:1:-1]
+    ids = []
+    position = digits.find('1')
+    while position != -1:
+        ids.append(position)
+        position = digits.find('1', position + 1)
+    return ids
+
+def _bitset_estimate(ids):
+    return max(ids) // 8 + 28 if ids else 0
+
+class BudgetExceeded(Exception):
+    pass
+
+class RangeIndex:
+    """
+    Bitsets over value ranges for one attribute: one per bucket of about the
+    same number of products, with each bucket's (value, id) pairs kept sorted
+    to resolve the buckets a query only partly covers.
+    """
+
+    def __init__(self, bounds=()):
+        self.bounds = list(bounds)    # lowest value of every bucket after the first
+        self.bits = [0] * (len(self.bounds) + 1)
+        self.entries = [[] for _ in self.bits]
+
+    @classmethod
+    def build(cls, pairs, buckets):
+        pairs.sort()
+        step = max(len(pairs) // buckets, 1)
+        index = cls(sorted({pairs[i][0] for i in range(step, len(pairs), step)}))
+        for value, pk in pairs:
+            index.entries[index._bucket(value)].append((value, pk))
+        index.bits = [bitset(pk for _, pk in entries) for entries in index.entries]
+        return index
+
+    def _bucket(self, value):
+        return bisect_right(self.bounds, value)
+
+    def add(self, value, pk):
+        bucket = self._bucket(value)
+        insort(self.entries[bucket], (value, pk))
+        self.bits[bucket] |= 1 << pk
+
+    def remove(self, value, pk):
+        bucket = self._bucket(value)
+        entries = self.entries[bucket]
+        del entries[bisect_left(entries, (value, pk))]
+        self.bits[bucket] &= ~(1 << pk)
+
+    def _slice(self, bucket, low, high):
+        entries = self.entries[bucket]
+        start = bisect_left(entries, (low,)) if low is not None else 0
+        stop = bisect_right(entries, (high, math.inf)) if high is not None else len(entries)
+        if start == 0 and stop == len(entries):
+            return self.bits[bucket]
+        return bitset(pk for _, pk in entries[start:stop])
+
+    def range(self, low=None, high=None):
+        """Bitset of the ids with low <= value <= high; either bound may be None"""
+        first = self._bucket(low) if low is not None else 0
+        last = self._bucket(high) if high is not None else len(self.bits) - 1
+        if first > last:
+            return 0
+        if first == last:
+            return self._slice(first, low, high)
+        bits = self._slice(first, low, None) | self._slice(last, None, high)
+        for bucket in range(first + 1, last):
+            bits |= self.bits[bucket]
+        return bits
+
+    def nbytes(self):
+        return sum(sys.getsizeof(bits) for bits in self.bits) + sum(
+            sys.getsizeof(entries) + len(entries) * ENTRY_BYTES for entries in self.entries
+        )
+
+class FilterIndex:
+    def __init__(self):
+        self.bitmaps = {}     # (attribute, value) -> bitset
+        self.ranges = {attribute: RangeIndex() for attribute in RANGE_ATTRIBUTES}
+        self.products = {}    # id -> indexed fields, so a product can be removed before it is re-added
+        self.all = 0
+        self.row_bytes = 0
+
+    @staticmethod
+    def _fields(category_id, brand, price, rating, in_stock_sizes):
+        # Brands repeat across the catalog, so store one string per brand
+        return category_id, sys.intern(brand.lower()), price, rating, in_stock_sizes
+
+    @staticmethod
+    def _row_bytes(fields):
+        # The tuple, its two decimals and the sizes string; ids and brands are shared
+        return ROW_BYTES + sys.getsizeof(fields[4])
+
+    @classmethod
+    def build(cls, rows, max_bytes, buckets=RANGE_BUCKETS):
+        """An index over (id, category_id, brand, price, rating, in_stock_sizes) rows"""
+        index = cls()
+        ids_by_key = {}
+        pairs = {attribute: [] for attribute in RANGE_ATTRIBUTES}
+        ids_by_sizes = {}
+        for pk, *fields in rows:
+            fields = index.products[pk] = cls._fields(*fields)
+            category_id, brand, price, rating, in_stock_sizes = fields
+            ids_by_key.setdefault(('category', category_id), []).append(pk)
+            ids_by_key.setdefault(('brand', brand), []).append(pk)
+            ids_by_sizes.setdefault(in_stock_sizes, []).append(pk)
+            pairs['price'].append((price, pk))
+            pairs['rating'].append((rating, pk))
+            index.row_bytes += cls._row_bytes(fields)
+            if index.row_bytes > max_bytes:
+                raise BudgetExceeded(index.row_bytes)
+        # Products with the same run of sizes share its keys
+        for in_stock_sizes, ids in ids_by_sizes.items():
+            for key in _size_keys(in_stock_sizes):
+                ids_by_key.setdefault(key, []).extend(ids)
+
+        # Size every bitset before allocating any of them
+        top = _bitset_estimate(list(index.products))
+        estimate = index.row_bytes + sum(_bitset_estimate(ids) for ids in ids_by_key.values()) + sum(
+            len(entries) * ENTRY_BYTES + (buckets + 1) * top for entries in pairs.values()
+        )
+        if estimate > max_bytes:
+            raise BudgetExceeded(estimate)
+        index.bitmaps = {key: bitset(ids) for key, ids in ids_by_key.items()}
+        index.ranges = {
+            attribute: RangeIndex.build(entries, buckets) for attribute, entries in pairs.items()
+        }
+        index.all = bitset(index.products)
+        return index
+
+    def add(self, pk, *fields):
+        self.remove(pk)
+        fields = self._fields(*fields)
+        category_id, brand, price, rating, in_stock_sizes = fields
+        bit = 1 << pk
+        for key in product_keys(category_id, brand, in_stock_sizes):
+            self.bitmaps[key] = self.bitmaps.get(key, 0) | bit
+        self.ranges['price'].add(price, pk)
+        self.ranges['rating'].add(rating, pk)
+        self.products[pk] = fields
+        self.row_bytes += self._row_bytes(fields)
+        self.all |= bit
+
+    def remove(self, pk):
+        fields = self.products.pop(pk, None)
+        if fields is None:
+            return
+        category_id, brand, price, rating, in_stock_sizes = fields
+        mask = ~(1 << pk)
+        for key in product_keys(category_id, brand, in_stock_sizes):
+            remaining = self.bitmaps[key] & mask
+            if remaining:
+                self.bitmaps[key] = remaining
+            else:
+                del self.bitmaps[key]
+        self.ranges['price'].remove(price, pk)
+        self.ranges['rating'].remove(rating, pk)
+        self.row_bytes -= self._row_bytes(fields)
+        self.all &= mask
+
+    def _any(self, attribute, values):
+        bits = 0
+        for value in values:
+            bits |= self.bitmaps.get((attribute, value), 0)
+        return bits
+
+    def match(self, spec):
+        """The bitset of products matching a facets.parse_filters() result"""
+        bits = self.all
+        if 'category' in spec:
+            bits &= self._any('category', spec['category'])
+        if 'brand' in spec:
+            bits &= self._any('brand', {brand.lower() for brand in spec['brand']})
+        if 'size' in spec:
+            size, gender = spec['size']
+            if size and gender:
+                bits &= self.bitmaps.get(('gender_size', f'{gender}:{size}'), 0)
+            elif size:
+                bits &= self.bitmaps.get(('size', size), 0)
+            else:
+                bits &= self.bitmaps.get(('gender', gender), 0)
+        if 'price' in spec:
+            bits &= self.ranges['price'].range(*spec['price'])
+        if 'rating' in spec:
+            bits &= self.ranges['rating'].range(spec['rating'])
+        return bits
+
+    def nbytes(self):
+        """Approximate memory held: bitsets, range entries and the stored product fields"""
+        bitmaps = sum(sys.getsizeof(bits) for bits in self.bitmaps.values())
+        ranges = sum(index.nbytes() for index in self.ranges.values())
+        return bitmaps + ranges + sys.getsizeof(self.all) + self.row_bytes
+
+    def stats(self):
+        return {'products': len(self.products), 'bitmaps': len(self.bitmaps), 'bytes': self.nbytes()}
+
+_lock = threading.RLock()
+# Serializes reloads, which read the database outside _lock, so they apply in
+# the order they read; always taken before _lock, never inside it
+_reload_lock = threading.Lock()
+# `own` holds the (model, version) bumps this process made for changes it reloads itself
+_state = {
+    'index': None, 'versions': None, 'own': set(), 'building': False, 'missed': set(), 'disabled': False,
+}
+_pending = threading.local()
+
+def enabled():
+    return getattr(settings, 'CATALOG_FILTER_INDEX', False) and not _state['disabled']
+
+def _max_bytes():
+    return getattr(settings, 'CATALOG_FILTER_INDEX_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+def _products():
+    from store.models import Product
+    # Always the primary, so a lagging replica never leaves the index behind
+    return Product.objects.using(DEFAULT_DB_ALIAS).order_by()
+
+def _rebuild(versions):
+    """Build a new index without holding the lock; queries use SQL meanwhile"""
+    try:
+        index = FilterIndex.build(_products().values_list(*COLUMNS).iterator(), _max_bytes())
+    except BudgetExceeded as exc:
+        logger.warning(
+            'Catalog filter index needs about %s bytes, over the %s byte limit; filtering in SQL',
+            exc.args[0], _max_bytes(),
+        )
+        with _lock:
+            _state.update(index=None, versions=None, building=False, disabled=True)
+        return
+    except Exception:
+        with _lock:
+            _state['building'] = False
+        raise
+    with _reload_lock:
+        with _lock:
+            # Products committed while the scan ran may be missing from it
+            missed, _state['missed'] = _state['missed'], set()
+        rows = _fetch(missed)
+        with _lock:
+            _apply(index, missed, rows)
+            _state.update(index=index, versions=versions, own=_newer(_state['own'], versions), building=False)
+
+def _newer(own, versions):
+    latest = dict(zip(VERSION_MODELS, versions))
+    return {(model, version) for model, version in own if version > latest[model]}
+
+def _changes_key(model_name, version):
+    return f'{catalog_cache.KEY_PREFIX}:changes:{model_name}:{version}'
+
+def _changes_since(stamped, versions, own):
+    """
+    Ids of the products changed between two version tuples by other
+    processes, or None if any of the changes was not published
+    """
+    keys = []
+    for model, old, new in zip(VERSION_MODELS, stamped, versions):
+        if not old <= new <= old + MAX_CATCH_UP:
+            return None
+        # Versions this process bumped itself are already in the index
+        keys += [
+            _changes_key(model, version) for version in range(old + 1, new + 1) if (model, version) not in own
+        ]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return None
+    return set().union(*changes.values())
+
+def _catch_up(stamped, versions, ids):
+    with _reload_lock:
+        rows = _fetch(ids)
+        with _lock:
+            if _state['versions'] == stamped and _state['index'] is not None:
+                _apply(_state['index'], ids, rows)
+                _state.update(versions=versions, own=_newer(_state['own'], versions))
+            # Otherwise another thread caught up or rebuilt first
+            return _state['index'] if _state['versions'] == versions else None
+
+def get_filter_index():
+    """The current index, or None when it is off or being rebuilt"""
+    if not enabled():
+        return None
+    versions = catalog_cache.get_versions(VERSION_MODELS)
+    with _lock:
+        if _state['versions'] == versions:
+            return _state['index']
+        if _state['building']:
+            return None
+        stamped, own = _state['versions'], set(_state['own'])
+    ids = _changes_since(stamped, versions, own) if stamped else None
+    if ids is not None:
+        return _catch_up(stamped, versions, ids)
+    with _lock:
+        if _state['building']:
+            return None
+        _state['building'] = True
+    # Changes nobody published: this request rebuilds the index, others filter in SQL
+    _rebuild(versions)
+    with _lock:
+        return _state['index'] if _state['versions'] == versions else None
+
+def match(spec):
+    """Ids of the products matching `spec`, or None to filter in SQL instead"""
+    index = get_filter_index()
+    if index is None:
+        return None
+    with _lock:
+        bits = index.match(spec)
+    if bits.bit_count() > MAX_MATCHED_IDS:
+        return None
+    return bitset_ids(bits)
+
+def publish_changes(model_name, version, product_ids):
+    """Let other processes reload the products changed by `version` of `model_name`"""
+    cache.set(_changes_key(model_name, version), sorted(product_ids), catalog_cache.get_timeout())
+
+def catalog_changed(model_name, product_ids=(), version=None):
+    """
+    Record a change this process made to the catalog, right after
+    catalog_cache.bump_version() returned `version` for `model_name`. The
+    change is published for other processes, and the products are reloaded
+    into this process's index once the transaction commits.
+    """
+    if not getattr(settings, 'CATALOG_FILTER_INDEX', False):
+        return
+    product_ids = {int(pk) for pk in product_ids}
+    if version is not None:
+        publish_changes(model_name, version, product_ids)
+    if not enabled():
+        return
+    if version is not None:
+        with _lock:
+            _state['own'].add((model_name, version))
+    if not product_ids:
+        return
+    ids = getattr(_pending, 'ids', None)
+    if ids is None:
+        ids = _pending.ids = set()
+    ids.update(product_ids)
+    # The first callback to run reloads everything queued in this thread; ids
+    # left over from a rolled-back transaction are harmlessly reloaded with it
+    transaction.on_commit(_flush)
+
+def _fetch(ids):
+    # Read before taking _lock, so match() never waits on the database
+    return list(_products().filter(pk__in=ids).values_list(*COLUMNS)) if ids else []
+
+def _apply(index, ids, rows):
+    for pk in ids:
+        index.remove(pk)
+    for pk, *fields in rows:
+        index.add(pk, *fields)
+
+def _flush():
+    ids = getattr(_pending, 'ids', None) or set()
+    _pending.ids = None
+    if not ids:
+        return
+    with _reload_lock:
+        rows = _fetch(ids)
+        with _lock:
+            if _state['building']:
+                _state['missed'].update(ids)
+            index = _state['index']
+            if index is None:
+                return
+            _apply(index, ids, rows)
+            if index.nbytes() > _max_bytes():
+                logger.warning('Catalog filter index outgrew its %s byte limit; filtering in SQL', _max_bytes())
+                _state.update(index=None, versions=None, disabled=True)
+
+def stats():
+    """Size of the current index, or None when it is off or not built yet"""
+    with _lock:
+        index = _state['index']
+        return index.stats() if index is not None else None
+
+def reset():
+    """Forget the index; the next query builds it again"""
+    _pending.ids = None
+    with _lock:
+        _state.update(index=None, versions=None, own=set(), building=False, missed=set(), disabled=False)
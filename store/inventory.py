@@ -0,0 +1,101 @@
+"""
+Stock reservation.
+
+Stock is decremented with conditional UPDATEs, so the availability check
+and the decrement happen atomically in the database and concurrent
+checkouts can never drive a size below zero. The products' availability
+summaries are refreshed once the reservation commits. A reservation that
+takes a size from above LOW_STOCK_THRESHOLD to at or below it queues a
+low-stock alert job.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from store import cache as catalog_cache
+from store import filter_index, jobs
+from store.models import Product, Size
+
+class InsufficientStock(Exception):
+    """Raised when one or more sizes no longer have enough stock"""
+
+    def __init__(self, shortages):
+        # {size_id: requested quantity} for every line that could not be filled
+        self.shortages = shortages
+        super().__init__(f'Not enough stock for sizes {sorted(shortages)}')
+
+def reserve_stock(size_id, quantity):
+    """
+    Take `quantity` units of a size out of stock or raise InsufficientStock.
+
+    Call inside transaction.atomic() together with the rows that consume the
+    stock, so a failure later in the transaction returns the units.
+    """
+    updated = Size.objects.filter(pk=size_id, quantity__gte=quantity).update(
+        quantity=F('quantity') - quantity
+    )
+    if not updated:
+        raise InsufficientStock({size_id: quantity})
+    _stock_updated([size_id], reserved={size_id: quantity})
+
+def release_stock(size_id, quantity):
+    """Put `quantity` units of a size back in stock, such as those of a removed order line"""
+    Size.objects.filter(pk=size_id).update(quantity=F('quantity') + quantity)
+    _stock_updated([size_id])
+
+def reserve_stock_bulk(quantities):
+    """
+    Reserve stock for a whole cart, given as {size_id: quantity}, with one
+    UPDATE statement however many lines it has.
+
+    Either every line is reserved or none is and InsufficientStock is raised.
+    """
+    requested = Case(
+        *[When(pk=size_id, then=Value(quantity)) for size_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    try:
+        with transaction.atomic():
+            updated = Size.objects.filter(pk__in=quantities, quantity__gte=requested).update(
+                quantity=F('quantity') - requested
+            )
+            if updated != len(quantities):
+                raise InsufficientStock(quantities)
+    except InsufficientStock:
+        # The savepoint is rolled back, so remaining stock shows which lines were short
+        available = dict(Size.objects.filter(pk__in=quantities).values_list('pk', 'quantity'))
+        shortages = {
+            size_id: quantity for size_id, quantity in quantities.items()
+            if available.get(size_id, 0) < quantity
+        }
+        raise InsufficientStock(shortages or quantities)
+    _stock_updated(list(quantities), reserved=quantities)
+
+def _stock_updated(size_ids, reserved=None):
+    rows = list(Size.objects.filter(pk__in=size_ids).values_list('pk', 'product_id', 'quantity'))
+    product_ids = {product_id for _, product_id, _ in rows}
+    if reserved:
+        threshold = getattr(settings, 'LOW_STOCK_THRESHOLD', 2)
+        # Only the reservation that crosses the threshold alerts, not every one below it
+        low = sorted(pk for pk, _, quantity in rows if quantity <= threshold < quantity + reserved[pk])
+        if low:
+            # Queued in this transaction, so a rolled-back reservation sends no alert
+            jobs.enqueue('stock.low_stock_alert', {'size_ids': low})
+    if connection.vendor == 'sqlite':
+        # SQLite locks the whole database for the transaction anyway, and a
+        # refresh started after the commit would have to upgrade a read lock
+        # while other checkouts write, which SQLite refuses rather than waits on
+        Product.objects.filter(pk__in=product_ids).refresh_availability()
+        transaction.on_commit(lambda: _stock_changed(product_ids))
+    else:
+        transaction.on_commit(lambda: _stock_changed(product_ids, refresh=True))
+
+def _stock_changed(product_ids, refresh=False):
+    # update() skips post_save, so refresh the availability summaries and
+    # invalidate cached catalog pages ourselves. The refresh runs after the
+    # commit so the product rows it locks are held for its own short
+    # transaction, not for the rest of every checkout of the product; if it
+    # fails, rebuild_availability corrects the summaries.
+    if refresh:
+        Product.objects.filter(pk__in=product_ids).refresh_availability()
+    version = catalog_cache.bump_version('size')
+    filter_index.catalog_changed('size', product_ids, version)
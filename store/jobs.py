@@ -0,0 +1,132 @@
+"""
+Background jobs.
+
+Side effects that need not hold up the response, such as confirmation
+emails and low-stock alerts, are queued as Job rows and run by
+`manage.py run_worker`. Tasks are plain functions registered with @task
+(see store/tasks.py) and receive the job's payload as keyword arguments.
+
+enqueue() inserts the job in the caller's transaction: workers only see it
+once the order or stock change that caused it has committed, and it is
+dropped with that change on rollback. A job with an idempotency key is
+enqueued at most once.
+
+Workers claim a job with a conditional UPDATE that only one of them can
+win, so any number of worker threads and processes can share the table.
+A failed job is retried with exponential backoff until it has used its
+max_attempts, and a job whose worker died is claimed again once its lease
+has expired. Only the worker holding the current claim records the result.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from store.models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+# Seconds before a running job counts as abandoned and is claimed again
+DEFAULT_LEASE = 300
+# Retry n waits about BACKOFF * 2**(n - 1) seconds, capped at MAX_BACKOFF
+DEFAULT_BACKOFF = 10
+DEFAULT_MAX_BACKOFF = 3600
+
+_tasks = {}
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register a function as the task `name`"""
+    def register(function):
+        _tasks[name] = (function, max_attempts)
+        return function
+    return register
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """
+    Queue the task `name` with a JSON-serializable payload, to run no sooner
+    than `delay` seconds from now. Nothing is queued when a job with the
+    same idempotency `key` exists.
+    """
+    if name not in _tasks:
+        raise ValueError(f'Unknown task {name!r}')
+    job = Job(
+        task=name,
+        payload=payload or {},
+        idempotency_key=key,
+        max_attempts=_tasks[name][1],
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    Job.objects.bulk_create([job], ignore_conflicts=key is not None)
+
+def backoff(attempts):
+    """Seconds to wait after failed attempt number `attempts`, with jitter"""
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', DEFAULT_BACKOFF)
+    ceiling = getattr(settings, 'JOB_RETRY_MAX_BACKOFF', DEFAULT_MAX_BACKOFF)
+    delay = min(base * 2 ** (attempts - 1), ceiling)
+    # Jitter spreads out retries of jobs that failed together
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def _claimable(now, lease):
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=lease))
+
+def claim(worker, lease=DEFAULT_LEASE, candidates=10):
+    """The next due job, marked as running for `worker`, or None"""
+    now = timezone.now()
+    due = Job.objects.filter(_claimable(now, lease)).order_by('run_at', 'pk').values_list('pk', flat=True)
+    for pk in list(due[:candidates]):
+        # Another worker may have claimed it since; only one UPDATE can match
+        claimed = Job.objects.filter(_claimable(now, lease), pk=pk).update(
+            status=Job.RUNNING, locked_at=now, locked_by=worker, attempts=F('attempts') + 1, updated_at=now
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+def _finish(job, **fields):
+    # A job whose lease expired may have been claimed again; that claim owns the result
+    return Job.objects.filter(pk=job.pk, locked_by=job.locked_by, attempts=job.attempts).update(
+        locked_at=None, updated_at=timezone.now(), **fields
+    )
+
+def run_job(job):
+    """Run a claimed job and record the outcome: done, retried later or failed"""
+    function = _tasks.get(job.task, (None,))[0]
+    try:
+        if function is None:
+            raise LookupError(f'Unknown task {job.task!r}')
+        if job.attempts > job.max_attempts:
+            raise RuntimeError('Lease expired on the final attempt')
+        with transaction.atomic():
+            function(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if function is not None and job.attempts < job.max_attempts:
+            delay = backoff(job.attempts)
+            logger.warning(f"Job {job.task} #{job.pk} failed (attempt {job.attempts}), retrying in {delay:.0f}s")
+            _finish(job, status=Job.QUEUED, run_at=timezone.now() + timedelta(seconds=delay), last_error=error)
+        else:
+            logger.error(f"Job {job.task} #{job.pk} failed after {job.attempts} attempts")
+            _finish(job, status=Job.FAILED, last_error=error)
+        return False
+    _finish(job, status=Job.DONE, last_error='')
+    return True
+
+def work(worker, stop, poll_interval=1.0, lease=DEFAULT_LEASE, burst=False):
+    """
+    Claim and run jobs until `stop` (a threading.Event) is set, sleeping
+    `poll_interval` seconds whenever none is due; with `burst`, return
+    instead once no job is due
+    """
+    while not stop.is_set():
+        close_old_connections()
+        job = claim(worker, lease)
+        if job is None:
+            if burst:
+                return
+            stop.wait(poll_interval)
+            continue
+        run_job(job)
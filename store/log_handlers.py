@@ -0,0 +1,152 @@
+"""
+Non-blocking log shipping.
+
+QueueLogHandler is the only handler attached to the project loggers. It
+puts records on a bounded in-memory queue and returns immediately; a
+background QueueListener thread hands them to the real console and file
+handlers, so request threads never wait on log I/O.
+
+LazyFileHandler creates the log directory when the first record is
+written rather than at startup, and falls back to dropping file output
+(the console still gets every record) when it cannot.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+_active_handlers = []
+
+class _DrainingListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than failing on a full queue, so stop() always drains it
+        self.queue.put(self._sentinel)
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    Queue records for a background listener that feeds the named handlers.
+
+    Configured from settings.LOGGING, for example:
+
+        'queue': {
+            '()': 'store.log_handlers.QueueLogHandler',
+            'handlers': ['console', 'file'],
+            'maxsize': 10000,
+            'overflow': 'drop_oldest',
+        }
+
+    When the queue is full, `overflow` decides what happens: drop the oldest
+    queued record, drop the new one, or block until there is room. Drops are
+    counted in `dropped`.
+    """
+
+    def __init__(self, handlers=(), maxsize=10000, overflow='drop_oldest'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'overflow must be one of {OVERFLOW_POLICIES}, not {overflow!r}')
+        super().__init__(queue.Queue(maxsize))
+        self.handler_names = list(handlers)
+        self.targets = self._resolve_handlers()
+        self.overflow = overflow
+        self.dropped = 0
+        self.listener = None
+        self._listener_pid = None
+        self._lock = threading.Lock()
+        _active_handlers.append(self)
+
+    def enqueue(self, record):
+        if self._listener_pid != os.getpid():
+            self.start()
+
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                if self.overflow == 'drop_newest':
+                    self.dropped += 1
+                    return
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def start(self):
+        """Start the listener; also restarts it in a freshly forked worker"""
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            # A forked worker inherits the queue but not the listener thread
+            self.listener = _DrainingListener(
+                self.queue, *self.targets, respect_handler_level=True
+            )
+            self.listener.start()
+            self._listener_pid = os.getpid()
+
+    def stop(self):
+        """Flush every queued record to the target handlers and stop the listener"""
+        with self._lock:
+            if self.listener is not None and self._listener_pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self._listener_pid = None
+
+    def close(self):
+        self.stop()
+        super().close()
+
+    def _resolve_handlers(self):
+        # Target handlers are looked up by their settings.LOGGING names. Only
+        # weak references to them exist elsewhere, so keep strong ones here.
+        get_handler = getattr(logging, 'getHandlerByName', None) or logging._handlers.get
+        handlers = []
+        for name in self.handler_names:
+            handler = get_handler(name)
+            if handler is None:
+                # dictConfig retries handlers failing with this message once the rest exist
+                raise ValueError(f'target not configured yet: {name}')
+            handlers.append(handler)
+        return handlers
+
+class LazyFileHandler(logging.FileHandler):
+    """FileHandler that creates its directory on first write; use with delay=True"""
+
+    def __init__(self, filename, *args, **kwargs):
+        self.unavailable = False
+        super().__init__(filename, *args, **kwargs)
+
+    def emit(self, record):
+        if self.unavailable:
+            return
+        if self.stream is None:
+            try:
+                os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+                self.stream = self._open()
+            except OSError:
+                # Read-only filesystem and the like: log to the console only
+                self.unavailable = True
+                return
+        super().emit(record)
+
+def queue_stats():
+    """Queue depth and dropped-record counts for every queue handler"""
+    return [
+        {
+            'handlers': handler.handler_names,
+            'queued': handler.queue.qsize(),
+            'dropped': handler.dropped,
+        }
+        for handler in _active_handlers
+    ]
+
+@atexit.register
+def _flush_on_shutdown():
+    for handler in _active_handlers:
+        handler.stop()
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.core import signals
+from django.db import DEFAULT_DB_ALIAS, connections
+from time import perf_counter
+
+class Command(BaseCommand):
+    help = 'Compare per-request database cost with and without persistent connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Simulated requests per mode')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--max-age', type=int, default=600, help='CONN_MAX_AGE for the persistent run')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        original_max_age = connection.settings_dict['CONN_MAX_AGE']
+        results = {}
+
+        try:
+            for label, max_age in (('per-request connections', 0), ('persistent connections', options['max_age'])):
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+                results[label] = self.run_requests(connection, options['requests'])
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = original_max_age
+
+        for label, elapsed in results.items():
+            self.stdout.write(f'{label}: {elapsed * 1000 / options["requests"]:.2f} ms/request')
+
+        saved = results['per-request connections'] - results['persistent connections']
+        self.stdout.write(self.style.SUCCESS(
+            f'Connection setup saved: {saved * 1000 / options["requests"]:.2f} ms/request'
+        ))
+
+    def run_requests(self, connection, count):
+        """Run `count` one-query request cycles, firing the signals Django uses to manage connections"""
+        start = perf_counter()
+        for _ in range(count):
+            signals.request_started.send(sender=self.__class__)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            signals.request_finished.send(sender=self.__class__)
+        return perf_counter() - start
@@ -0,0 +1,57 @@
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from store.facets import filter_conditions, parse_filters
+from store.filter_index import COLUMNS, DEFAULT_MAX_BYTES, BudgetExceeded, FilterIndex, bitset_ids
+from store.models import Product
+
+DEFAULT_QUERIES = [
+    'in_stock_size=10&gender=M',
+    'min_price=80&max_price=150&min_rating=3',
+    'gender=W&min_price=100&min_rating=4',
+    'in_stock_size=9&max_price=120&min_rating=2',
+]
+
+class Command(BaseCommand):
+    help = 'Build the catalog filter index, report its memory use and compare filter times with SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--query', action='append', dest='queries',
+            help='Filter query string, e.g. "brand=Nike&min_price=100"; repeatable',
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query and engine')
+        parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES, help='Memory limit for the build')
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        try:
+            index = FilterIndex.build(Product.objects.order_by().values_list(*COLUMNS).iterator(), options['max_bytes'])
+        except BudgetExceeded as exc:
+            raise CommandError(f'The index needs about {exc.args[0]} bytes, over --max-bytes')
+        stats = index.stats()
+        self.stdout.write(
+            f'Built in {(perf_counter() - start) * 1000:.1f} ms: {stats["products"]} products, '
+            f'{stats["bitmaps"]} bitsets, {stats["bytes"] / 1024:.1f} KiB'
+        )
+
+        for query in options['queries'] or DEFAULT_QUERIES:
+            spec = parse_filters(QueryDict(query))
+            products = Product.objects.order_by('pk')
+            for condition in filter_conditions(spec).values():
+                products = products.filter(condition)
+
+            start = perf_counter()
+            for _ in range(options['repeat']):
+                expected = list(products.values_list('pk', flat=True))
+            sql = (perf_counter() - start) / options['repeat']
+            start = perf_counter()
+            for _ in range(options['repeat']):
+                ids = bitset_ids(index.match(spec))
+            in_memory = (perf_counter() - start) / options['repeat']
+
+            if ids != expected:
+                raise CommandError(f'{query}: index and SQL matched different products')
+            self.stdout.write(
+                f'{query}: {len(ids)} products, SQL {sql * 1000:.3f} ms, index {in_memory * 1000:.3f} ms'
+            )
@@ -0,0 +1,42 @@
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from store.models import Product
+from store.renderers import ORJSONRenderer, orjson
+from store.serializers.product_serializer import ProductSerializer
+
+class Command(BaseCommand):
+    help = 'Compare JSON encode time of a product list page with the stdlib and orjson renderers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100, help='Products on the page')
+        parser.add_argument('--repeat', type=int, default=200, help='Renders per renderer')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson is not installed')
+        products = Product.objects.with_catalog_data().order_by('name', 'id')[:options['products']]
+        data = {'count': len(products), 'next': None, 'previous': None,
+                'results': ProductSerializer(products, many=True).data}
+        if not data['results']:
+            raise CommandError('No products to render; seed some with manage.py seed_fixture')
+
+        timings = {}
+        outputs = {}
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            name = type(renderer).__name__
+            start = perf_counter()
+            for _ in range(options['repeat']):
+                outputs[name] = renderer.render(data, 'application/json')
+            timings[name] = (perf_counter() - start) / options['repeat']
+
+        if outputs['JSONRenderer'] != outputs['ORJSONRenderer']:
+            raise CommandError('Renderers produced different output')
+
+        for name, elapsed in timings.items():
+            self.stdout.write(f'{name}: {elapsed * 1000:.3f} ms/page')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(data["results"])} products, {len(outputs["JSONRenderer"]) / 1024:.1f} KiB, identical output; '
+            f'orjson saves {(timings["JSONRenderer"] - timings["ORJSONRenderer"]) * 1000:.3f} ms/page '
+            f'({timings["JSONRenderer"] / timings["ORJSONRenderer"]:.1f}x faster)'
+        ))
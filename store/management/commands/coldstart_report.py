@@ -0,0 +1,80 @@
+import json
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: import the Vercel entry point, then serve one request
+PROBE = """
+import io, json, sys, time
+start = time.perf_counter()
+import wsgi_handler
+imported = time.perf_counter()
+statuses = []
+wsgi_handler.app({
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': 'coldstart.vercel.app', 'SERVER_PORT': '443', 'HTTP_HOST': 'coldstart.vercel.app',
+    'wsgi.url_scheme': 'https', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+}, lambda status, headers, exc_info=None: statuses.append(status))
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'request_ms': (served - imported) * 1000, 'status': statuses[0]}))
+"""
+
+class Command(BaseCommand):
+    help = 'Measure serverless cold-start time of wsgi_handler with python -X importtime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/', help='Path of the first request to serve')
+        parser.add_argument('--runs', type=int, default=3, help='Probes to run; the median is reported')
+        parser.add_argument('--top', type=int, default=15, help='Number of slowest packages to list')
+        parser.add_argument('--budget-ms', type=float, help='Fail if import plus first request exceeds this')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        probes = sorted(
+            (self.probe(options['path']) for _ in range(max(options['runs'], 1))),
+            key=lambda probe: probe[0]['import_ms'] + probe[0]['request_ms'],
+        )
+        timings, packages = probes[len(probes) // 2]
+        total_ms = timings['import_ms'] + timings['request_ms']
+        report = {
+            **timings,
+            'total_ms': total_ms,
+            'budget_ms': options['budget_ms'],
+            'packages': dict(sorted(packages.items(), key=lambda item: -item[1])[:options['top']]),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"Import wsgi_handler: {timings['import_ms']:.0f} ms")
+            self.stdout.write(f"First request ({options['path']} -> {timings['status']}): {timings['request_ms']:.0f} ms")
+            self.stdout.write(f'Cold start total: {total_ms:.0f} ms')
+            self.stdout.write('Slowest packages by self import time:')
+            for package, ms in report['packages'].items():
+                self.stdout.write(f'  {ms:8.1f} ms  {package}')
+
+        if options['budget_ms'] is not None and total_ms > options['budget_ms']:
+            raise CommandError(f"Cold start took {total_ms:.0f} ms, over the {options['budget_ms']:.0f} ms budget")
+
+    def probe(self, path):
+        """Cold-start wsgi_handler in a fresh interpreter and return (timings, package import times)"""
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE, path],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Cold-start probe failed:\n{result.stderr[-2000:]}')
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        return timings, self.package_import_times(result.stderr)
+
+    def package_import_times(self, importtime_output):
+        """Sum -X importtime self times (microseconds) by top-level package, in ms"""
+        totals = defaultdict(float)
+        for line in importtime_output.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, module = line[len('import time:'):].split('|')
+            totals[module.strip().split('.')[0]] += int(self_us) / 1000
+        return totals
@@ -0,0 +1,49 @@
+import sys
+import time
+from django.core.management.base import BaseCommand
+from store.export import DEFAULT_CHUNK_SIZE, iter_catalog, iter_gzip, iter_ndjson
+
+class Command(BaseCommand):
+    help = 'Stream the product catalog to NDJSON (optionally gzipped) with flat memory use'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-',
+                            help='File to write; "-" for stdout. A .gz suffix implies --gzip')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Products fetched per database round trip')
+        parser.add_argument('--database', default=None,
+                            help='Database alias to read from, e.g. replica')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        gzip = options['gzip'] or output.endswith('.gz')
+        exported = 0
+
+        def counted(records):
+            nonlocal exported
+            for record in records:
+                exported += 1
+                yield record
+
+        chunks = iter_ndjson(counted(iter_catalog(options['chunk_size'], options['database'])))
+        if gzip:
+            chunks = iter_gzip(chunks)
+
+        start = time.monotonic()
+        written = 0
+        stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for chunk in chunks:
+                stream.write(chunk)
+                written += len(chunk)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+            else:
+                stream.flush()
+
+        elapsed = time.monotonic() - start
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {exported} products ({written / 1024:.1f} KiB) in {elapsed:.2f}s'
+        ))
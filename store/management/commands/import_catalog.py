@@ -0,0 +1,96 @@
+import json
+import os
+import time
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from store.catalog_import import (
+    CatalogImporter, InvalidRecord, clean_record, feed_format, open_feed, read_records
+)
+
+class Command(BaseCommand):
+    help = 'Upsert products and sizes from a CSV or NDJSON supplier feed, in resumable chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file (.csv, .ndjson or .jsonl, optionally .gz)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Feed format; guessed from the file name by default')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Records validated and committed per transaction')
+        parser.add_argument('--checkpoint', help='Checkpoint file; defaults to <path>.checkpoint')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore an existing checkpoint and import from the first record')
+        parser.add_argument('--max-errors', type=int, default=100,
+                            help='Abort once this many records have failed validation')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        skip = 0 if options['restart'] else self.read_checkpoint(checkpoint_path, path)
+        if skip:
+            self.stdout.write(f'Resuming after record {skip}')
+
+        importer = CatalogImporter()
+        done, imported, errors = skip, 0, 0
+        start = time.monotonic()
+
+        with open_feed(path) as stream:
+            records = enumerate(read_records(stream, options['format'] or feed_format(path)), 1)
+            for _ in islice(records, skip):
+                pass
+            while True:
+                chunk = list(islice(records, options['chunk_size']))
+                if not chunk:
+                    break
+                valid = []
+                for number, record in chunk:
+                    try:
+                        valid.append(clean_record(record))
+                    except InvalidRecord as e:
+                        errors += 1
+                        self.stderr.write(f'Record {number}: {e}')
+                if errors > options['max_errors']:
+                    raise CommandError(
+                        f'Aborting after {errors} invalid records; rerun to resume from record {done}'
+                    )
+                if valid:
+                    imported += importer.import_chunk(valid)
+                done = chunk[-1][0]
+                self.write_checkpoint(checkpoint_path, path, done)
+
+                elapsed = time.monotonic() - start
+                self.stdout.write(
+                    f'{done} records read, {imported} upserted, {errors} invalid '
+                    f'({(done - skip) / elapsed:.0f} rows/s)'
+                )
+
+        importer.finish()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} products from {done - skip} records in {elapsed:.1f}s '
+            f'({(done - skip) / elapsed if elapsed else 0:.0f} rows/s, {errors} invalid)'
+        ))
+
+    def read_checkpoint(self, checkpoint_path, path):
+        try:
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return 0
+        stat = os.stat(path)
+        if checkpoint.get('size') != stat.st_size or checkpoint.get('mtime') != stat.st_mtime:
+            raise CommandError(
+                f'{path} changed since checkpoint {checkpoint_path} was written; use --restart'
+            )
+        return checkpoint['records']
+
+    def write_checkpoint(self, checkpoint_path, path, records):
+        # Written after each chunk commits; replaced atomically so a crash never leaves it half written
+        stat = os.stat(path)
+        tmp = f'{checkpoint_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'records': records, 'size': stat.st_size, 'mtime': stat.st_mtime}, f)
+        os.replace(tmp, checkpoint_path)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from store import cache as catalog_cache
+from store.models import Product
+
+class Command(BaseCommand):
+    help = "Recompute every product's availability summary from its sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Products refreshed per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        refreshed = 0
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+            refreshed += Product.objects.filter(pk__in=batch).refresh_availability()
+        catalog_cache.bump_version('product')
+        self.stdout.write(self.style.SUCCESS(f'Refreshed availability for {refreshed} products'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from store.models import Order
+from store.order_totals import expected_totals, fix_totals
+
+class Command(BaseCommand):
+    help = "Check every order's total and line totals against its items"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Orders checked per aggregate query')
+        parser.add_argument('--fix', action='store_true',
+                            help='Recompute the totals of mismatched orders from their items')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = mismatched = fixed = 0
+        last_pk = 0
+        while True:
+            # Keyset chunks by primary key, one grouped aggregate query each
+            rows = list(expected_totals(Order.objects.filter(pk__gt=last_pk).order_by('pk'))[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            checked += len(rows)
+            mismatches = [
+                (pk, total, expected) for pk, total, expected, stored in rows
+                if total != expected or stored != expected
+            ]
+            for pk, total, expected in mismatches:
+                self.stdout.write(f'Order #{pk}: total {total}, items add up to {expected}')
+            mismatched += len(mismatches)
+            if mismatches and options['fix']:
+                fixed += fix_totals([pk for pk, _, _ in mismatches])
+
+        summary = f'Checked {checked} orders, {mismatched} mismatched'
+        if options['fix']:
+            summary += f', {fixed} fixed'
+        self.stdout.write(self.style.SUCCESS(summary))
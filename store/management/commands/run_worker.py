@@ -0,0 +1,51 @@
+import os
+import signal
+import socket
+import threading
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from store import jobs
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (store/tasks.py) until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Jobs run at once, one thread each')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait before looking again when no job is due')
+        parser.add_argument('--lease', type=int, default=jobs.DEFAULT_LEASE,
+                            help='Seconds after which a running job is presumed abandoned and run again')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency must be at least 1')
+        stop = threading.Event()
+        name = f'{socket.gethostname()}:{os.getpid()}'
+
+        def work(index):
+            try:
+                jobs.work(f'{name}:{index}', stop, options['poll_interval'], options['lease'], options['burst'])
+            finally:
+                connection.close()
+
+        def shut_down(signum, frame):
+            # Jobs in progress finish; nothing new is claimed
+            self.stdout.write('Stopping after the running jobs')
+            stop.set()
+
+        previous = {signum: signal.signal(signum, shut_down) for signum in (signal.SIGINT, signal.SIGTERM)}
+        threads = [threading.Thread(target=work, args=(index,), daemon=True) for index in range(concurrency)]
+        self.stdout.write(f'Worker {name} running {concurrency} thread(s)')
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                # Joined with a timeout so the main thread keeps handling signals
+                while thread.is_alive():
+                    thread.join(0.5)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS('Worker stopped'))
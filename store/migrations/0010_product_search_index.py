@@ -0,0 +1,27 @@
+from django.db import migrations
+
+INDEX_NAME = 'product_search_idx'
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.indexes import GinIndex
+    from store.search import product_search_vector
+    Product = apps.get_model('store', 'Product')
+    schema_editor.add_index(Product, GinIndex(product_search_vector(), name=INDEX_NAME))
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:20
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+TRIGRAM_INDEXES = {
+    'name': 'product_name_trgm_idx',
+    'brand': 'product_brand_trgm_idx',
+}
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.indexes import GinIndex
+    Product = apps.get_model('store', 'Product')
+    for field, name in TRIGRAM_INDEXES.items():
+        schema_editor.add_index(
+            Product, GinIndex(fields=[field], opclasses=['gin_trgm_ops'], name=name)
+        )
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES.values():
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='brand',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        # No-op outside Postgres
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
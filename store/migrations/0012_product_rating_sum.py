@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:23
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_rating_sum(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Product.objects.update(rating_sum=F('rating') * F('review_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_product_brand_trigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_rating_sum, migrations.RunPython.noop),
+    ]
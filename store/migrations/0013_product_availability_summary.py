@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:33
+
+from django.db import migrations, models
+from store.availability import summarize
+
+AVAILABILITY_FIELDS = ['total_stock', 'in_stock_sizes', 'min_size', 'max_size']
+
+
+def backfill_availability(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Size = apps.get_model('store', 'Size')
+    sizes = {}
+    for product_id, size, gender, quantity in Size.objects.values_list(
+        'product_id', 'size', 'gender', 'quantity'
+    ).iterator():
+        sizes.setdefault(product_id, []).append((size, gender, quantity))
+    products = [Product(pk=pk, **summarize(rows)) for pk, rows in sizes.items()]
+    Product.objects.bulk_update(products, AVAILABILITY_FIELDS, batch_size=500)
+
+
+def create_in_stock_sizes_index(apps, schema_editor):
+    # Backs the substring match of Product.objects.in_stock_in()
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.indexes import GinIndex
+    Product = apps.get_model('store', 'Product')
+    schema_editor.add_index(
+        Product,
+        GinIndex(fields=['in_stock_sizes'], opclasses=['gin_trgm_ops'], name='product_in_stock_trgm_idx'),
+    )
+
+
+def drop_in_stock_sizes_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS product_in_stock_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_product_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='in_stock_sizes',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_size',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=4, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_size',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=4, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_availability, migrations.RunPython.noop),
+        migrations.RunPython(create_in_stock_sizes_index, drop_in_stock_sizes_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:02
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_line_totals(apps, schema_editor):
+    OrderItem = apps.get_model('store', 'OrderItem')
+    OrderItem.objects.update(line_total=F('price') * F('quantity'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_order_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_line_totals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='in_stock_sizes',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
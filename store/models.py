@@ -1,6 +1,11 @@
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import F, Prefetch, Sum, Value
+from django.db.models.functions import Cast, Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from store.availability import in_stock_q, parse_in_stock_sizes, summarize
 
 # Create your models here.
 
@@ -17,23 +22,105 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def with_catalog_data(self):
+        """Load everything the catalog serializers read in a fixed number of queries"""
+        return self.select_related('category').prefetch_related(
+            Prefetch('sizes', queryset=Size.objects.order_by('gender', 'size'))
+        )
+
+    def in_stock_in(self, size, gender=None):
+        """Products with `size` in stock, for one gender or any, from the availability summary"""
+        return self.filter(in_stock_q(size, gender))
+
+    def refresh_availability(self):
+        """
+        Recompute the availability summary of the matched products from their
+        sizes. Returns the number of products refreshed.
+
+        Call it in the transaction that changed the sizes, or after it has
+        committed (as stock reservations do, to keep checkouts from queueing
+        on the product row). The product rows are locked first, so concurrent
+        refreshes of one product run in order and the last one reads every
+        committed size.
+        """
+        with transaction.atomic(using=self.db):
+            product_ids = list(self.select_for_update().order_by('pk').values_list('pk', flat=True))
+            if not product_ids:
+                return 0
+            sizes = {pk: [] for pk in product_ids}
+            rows = Size.objects.using(self.db).filter(product_id__in=product_ids).values_list(
+                'product_id', 'size', 'gender', 'quantity'
+            )
+            for product_id, size, gender, quantity in rows:
+                sizes[product_id].append((size, gender, quantity))
+            products = [Product(pk=pk, **summarize(product_sizes)) for pk, product_sizes in sizes.items()]
+            Product.objects.using(self.db).bulk_update(products, Product.AVAILABILITY_FIELDS)
+        return len(products)
+
+    def add_rating(self, rating):
+        """
+        Fold one rating into the matched products with a single UPDATE.
+
+        The average is recomputed in SQL from the stored rating_sum, so
+        concurrent raters never overwrite each other and the row lock is
+        held for one statement only. Returns the number of rows updated.
+        """
+        rating = Decimal(str(rating))
+        return self.update(
+            rating_sum=F('rating_sum') + rating,
+            review_count=F('review_count') + 1,
+            # Float divisor: sqlite would otherwise truncate integral sums
+            rating=(F('rating_sum') + rating) / Cast(F('review_count') + 1, models.FloatField()),
+            updated_at=timezone.now(),
+        )
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
+    # Supplier stock keeping unit, the natural key catalog imports upsert on
+    sku = models.CharField(max_length=50, unique=True, null=True, blank=True)
     description = models.TextField()
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products'
+    )
+    brand = models.CharField(max_length=100, blank=True, db_index=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=0)
     image = models.ImageField(upload_to='products/', null=True, blank=True)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    # Sum of all ratings received, so the average never accumulates rounding error
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     review_count = models.IntegerField(default=0)
+    # Availability summary of the product's sizes, kept current by refresh_availability()
+    total_stock = models.IntegerField(default=0, editable=False)
+    in_stock_sizes = models.TextField(blank=True, editable=False)
+    min_size = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True, editable=False)
+    max_size = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    AVAILABILITY_FIELDS = ['total_stock', 'in_stock_sizes', 'min_size', 'max_size']
+
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
+        # Composite (field, id) indexes back keyset pagination for each ordering
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_at_id_idx'),
+            models.Index(fields=['rating', 'id'], name='product_rating_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def available_sizes(self):
+        """In-stock sizes per gender, e.g. {'M': ['US 9', 'US 10']}"""
+        return parse_in_stock_sizes(self.in_stock_sizes)
+
 class Size(models.Model):
     GENDER_CHOICES = [
         ('M', 'Men'),
@@ -57,6 +144,25 @@ class Size(models.Model):
             self.size = f'US {self.size}'
         super().save(*args, **kwargs)
 
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """Load every order's items with their product and size in two more queries"""
+        return self.prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product', 'size').order_by('pk'))
+        )
+
+    def with_summary(self):
+        """Annotate item_count (units) and items_total, aggregated in SQL without loading the items"""
+        amount = models.DecimalField(max_digits=12, decimal_places=2)
+        return self.annotate(
+            item_count=Coalesce(Sum('items__quantity'), 0),
+            items_total=Coalesce(
+                Sum('items__line_total', output_field=amount),
+                Value(Decimal('0.00')),
+                output_field=amount,
+            ),
+        )
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('P', 'Pending'),
@@ -71,10 +177,17 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='P')
     shipping_address = models.TextField()
-    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Sum of the items' line totals, maintained by store.order_totals
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Order history: one user's orders, newest first
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} by {self.user.username}"
@@ -85,13 +198,56 @@ class OrderItem(models.Model):
     size = models.ForeignKey(Size, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # price * quantity, stored so order totals are summed without recomputing each line
+    line_total = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
 
     class Meta:
         ordering = ['order__created_at']
 
+    def save(self, *args, **kwargs):
+        self.line_total = Decimal(self.price) * self.quantity
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.quantity}x {self.product.name} (Size: {self.size.size})"
 
+class Job(models.Model):
+    """A queued background task, run by `manage.py run_worker` (see store.jobs)"""
+    QUEUED = 'Q'
+    RUNNING = 'R'
+    DONE = 'D'
+    FAILED = 'F'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Enqueueing a second job with the same key is a no-op
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            # Workers look for due jobs in run_at order
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.id} ({self.get_status_display()})"
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone_number = models.CharField(max_length=15, blank=True)
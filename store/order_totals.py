@@ -0,0 +1,81 @@
+"""
+Server-side order totals.
+
+Order.total_amount is the sum of the order's stored line totals (price x
+quantity, with the price fixed when the line was added) and is never taken
+from the client. add_items() and remove_item() adjust it with a relative
+UPDATE in the same transaction as the item insert or delete, so concurrent
+changes to one order cannot overwrite each other's totals.
+
+expected_totals() and fix_totals() back the reconcile_orders command, which
+checks historical orders against their items.
+"""
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from store.models import Order, OrderItem
+
+AMOUNT = models.DecimalField(max_digits=12, decimal_places=2)
+ZERO = Value(Decimal('0.00'), output_field=AMOUNT)
+
+def _adjust_total(order_id, amount):
+    Order.objects.filter(pk=order_id).update(
+        total_amount=F('total_amount') + amount, updated_at=timezone.now()
+    )
+
+def add_items(order, items):
+    """
+    Insert unsaved OrderItems into `order` and add their line totals to its
+    total, with one bulk insert and one UPDATE.
+
+    Call inside transaction.atomic() with the stock reservation. The
+    in-memory `order.total_amount` is not refreshed.
+    """
+    for item in items:
+        item.order = order
+        item.line_total = item.price * item.quantity
+    with transaction.atomic():
+        created = OrderItem.objects.bulk_create(items)
+        _adjust_total(order.pk, sum((item.line_total for item in items), Decimal('0.00')))
+    return created
+
+def remove_item(item):
+    """
+    Delete an order line and take its line total off the order's total.
+    Returns False, changing nothing, when the line was already deleted.
+    """
+    with transaction.atomic():
+        # Two requests may have loaded the same line; only the one whose DELETE matches adjusts the total
+        deleted, _ = OrderItem.objects.filter(pk=item.pk, order_id=item.order_id).delete()
+        if not deleted:
+            return False
+        _adjust_total(item.order_id, -item.line_total)
+    return True
+
+def _expected_total(line):
+    return Coalesce(Sum(line, output_field=AMOUNT), ZERO, output_field=AMOUNT)
+
+def expected_totals(orders):
+    """
+    (order id, total_amount, expected total, sum of stored line totals) for
+    each order in `orders`, from one grouped aggregate query; the expected
+    total is price x quantity summed over the order's items
+    """
+    return orders.annotate(
+        expected=_expected_total(F('items__price') * F('items__quantity')),
+        stored=_expected_total('items__line_total'),
+    ).values_list('pk', 'total_amount', 'expected', 'stored')
+
+def fix_totals(order_ids):
+    """Recompute the line totals and totals of the given orders from their items"""
+    line_totals = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order').annotate(
+        total=Sum('line_total', output_field=AMOUNT)
+    ).values('total')
+    with transaction.atomic():
+        OrderItem.objects.filter(order__in=order_ids).update(line_total=F('price') * F('quantity'))
+        return Order.objects.filter(pk__in=order_ids).update(
+            total_amount=Coalesce(Subquery(line_totals, output_field=AMOUNT), ZERO),
+            updated_at=timezone.now(),
+        )
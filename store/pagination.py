@@ -0,0 +1,116 @@
+import base64
+import json
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset pagination over (ordering field, id).
+
+    Each cursor carries the ordering value and id of the row at the page
+    boundary, so a page is a `WHERE (field, id) > (value, id) LIMIT n` range
+    scan on a composite index. There is no COUNT(*) and no OFFSET, so deep
+    pages cost the same as the first one.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = api_settings.ORDERING_PARAM
+    ordering_fields = ()
+    default_ordering = 'id'
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(request)
+        self.model_field = queryset.model._meta.get_field(self.field)
+
+        cursor = self.decode_cursor(request)
+        self.has_cursor = cursor is not None
+        self.reverse = bool(cursor and cursor['reverse'])
+
+        # Walking backwards flips the ordering and the comparison
+        descending = self.descending != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')
+
+        if cursor is not None:
+            lookup = 'lt' if descending else 'gt'
+            value = cursor['value']
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value}) |
+                Q(**{self.field: value, f'id__{lookup}': cursor['id']})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        field = ordering.lstrip('-')
+        if field not in self.ordering_fields and field != self.default_ordering:
+            field, ordering = self.default_ordering, self.default_ordering
+        return field, ordering.startswith('-')
+
+    def get_next_link(self):
+        # A page reached by stepping backwards always has rows after it
+        has_next = self.reverse or self.has_more
+        if not self.page or not has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        has_previous = self.has_more if self.reverse else self.has_cursor
+        if not self.page or not has_previous:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        value = self.model_field.value_to_string(instance)
+        payload = json.dumps({'value': value, 'id': instance.pk, 'reverse': reverse})
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+            # Converted here so a tampered value is rejected rather than failing in the query
+            value = self.model_field.to_python(cursor['value'])
+            if value is None or (isinstance(value, Decimal) and not value.is_finite()):
+                raise ValueError('Cursor value out of range')
+            pk = int(cursor['id'])
+            low, high = connection.ops.integer_field_ranges[self.model_field.model._meta.pk.get_internal_type()]
+            if not low <= pk <= high:
+                raise ValueError('Cursor id out of range')
+            return {
+                'value': value,
+                'id': pk,
+                'reverse': bool(cursor.get('reverse')),
+            }
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+class ProductCursorPagination(KeysetCursorPagination):
+    ordering_fields = ('price', 'created_at', 'rating')
+    default_ordering = 'name'
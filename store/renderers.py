@@ -0,0 +1,61 @@
+"""
+orjson-backed JSON renderer and parser for the API.
+
+ORJSONRenderer produces the same bytes as DRF's JSONRenderer with the
+project settings (compact separators, UTF-8 output, `Z` for UTC datetimes,
+Decimals as numbers, \\u2028/\\u2029 escaped) while encoding datetimes and
+UUIDs natively. Anything orjson cannot encode goes through DRF's encoder.
+Requests for indented output, integers beyond 64 bits, and installs without
+orjson fall back to the stdlib renderer. Two edge cases differ: NaN and
+infinite floats become null where the stdlib renderer raises, and floats
+use exponent notation without a sign or padding (1e16, not 1e+16).
+
+ORJSONParser parses UTF-8 request bodies with orjson, and otherwise behaves
+like JSONParser.
+"""
+import io
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS
+
+class ORJSONRenderer(JSONRenderer):
+    def __init__(self):
+        super().__init__()
+        self.default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Out-of-range integers and the like: let the stdlib report or handle them
+            return super().render(data, accepted_media_type, renderer_context)
+        # Keep the output a strict JavaScript subset, as JSONRenderer does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding') or 'utf-8'
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Let JSONParser parse what orjson cannot (such as huge integers) or word the error
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,185 @@
+"""
+Product search and autocomplete.
+
+On Postgres, search runs against a weighted `tsvector` expression over
+name and description that is backed by a GIN index (migration 0010), with
+ranked results and prefix matching on every term for type-ahead. Other
+databases fall back to case-insensitive substring matching so local and
+test runs behave the same way.
+
+Autocomplete uses the pg_trgm indexes on name and brand (migration 0011).
+Without Postgres it is served from an in-process prefix trie rebuilt
+whenever the product catalog version changes.
+"""
+import re
+import threading
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Lookup, Q, Value, When
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+from store import cache as catalog_cache
+
+SEARCH_CONFIG = 'english'
+
+def product_search_vector():
+    """The indexed expression; queries must build it the same way to use the index"""
+    from django.contrib.postgres.search import SearchVector
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG) +
+        SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+def search_products(queryset, query):
+    """Filter and rank a Product queryset by a free-text query"""
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+    if connection.vendor == 'postgresql':
+        return _postgres_search(queryset, terms)
+    return _fallback_search(queryset, terms)
+
+def _postgres_search(queryset, terms):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+    # Every term must match; each is a prefix so "run" finds "running"
+    search_query = SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms), config=SEARCH_CONFIG, search_type='raw'
+    )
+    vector = product_search_vector()
+    # alias() keeps the vector and rank out of the SELECT list
+    return queryset.alias(search=vector).filter(search=search_query).alias(
+        search_rank=SearchRank(vector, search_query)
+    ).order_by('-search_rank', 'name', 'id')
+
+def _fallback_search(queryset, terms):
+    for term in terms:
+        queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+    first = terms[0]
+    return queryset.alias(
+        search_rank=Case(
+            When(name__istartswith=first, then=Value(2)),
+            When(name__icontains=first, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    ).order_by('-search_rank', 'name', 'id')
+
+class ProductSearchFilter(BaseFilterBackend):
+    """Apply `?search=` through search_products()"""
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        return search_products(queryset, query)
+
+
+class PrefixTrie:
+    """Character trie mapping lowercase prefixes to (kind, value) completions"""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key, completion):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(None, set()).add(completion)
+
+    def complete(self, prefix, limit):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        # Breadth-first, so shorter completions come before longer ones
+        results, level = {}, [node]
+        while level and len(results) < limit:
+            next_level = []
+            for current in level:
+                for completion in sorted(current.get(None, ()), key=_completion_order):
+                    results.setdefault(completion)
+                next_level.extend(
+                    current[char] for char in sorted(key for key in current if key is not None)
+                )
+            level = next_level
+        return list(results)[:limit]
+
+def _completion_order(completion):
+    kind, value = completion
+    return (kind != 'brand', value)
+
+_trie_lock = threading.Lock()
+_trie_state = {'version': None, 'trie': None}
+
+def get_suggestion_trie():
+    """Return the catalog trie, rebuilding it if the catalog changed since"""
+    version = catalog_cache.get_version('product')
+    if _trie_state['version'] == version:
+        return _trie_state['trie']
+
+    from store.models import Product
+    with _trie_lock:
+        if _trie_state['version'] != version:
+            trie = PrefixTrie()
+            for name, brand in Product.objects.values_list('name', 'brand').iterator():
+                # Index every word start so "runner" completes "Trail Runner"
+                for match in re.finditer(r'\w+', name.lower()):
+                    trie.insert(name.lower()[match.start():], ('name', name))
+                if brand:
+                    trie.insert(brand.lower(), ('brand', brand))
+            if catalog_cache.replica_may_be_stale():
+                # Built from a replica that may predate this version; don't keep it
+                return trie
+            _trie_state.update(version=version, trie=trie)
+    return _trie_state['trie']
+
+def suggest_products(query, limit=8):
+    """Return up to `limit` brand and name completions for a type-ahead query"""
+    query = query.strip()
+    if not query:
+        return []
+    if connection.vendor == 'postgresql':
+        completions = _postgres_suggest(query, limit)
+    else:
+        completions = get_suggestion_trie().complete(query.lower(), limit)
+    return [{'type': kind, 'value': value} for kind, value in completions]
+
+class ILike(Lookup):
+    """
+    `lhs ILIKE rhs` on the bare column. Django's icontains and istartswith
+    compile to UPPER(col::text) LIKE UPPER(...) on Postgres, which the
+    gin_trgm_ops indexes on name and brand cannot serve.
+    """
+    lookup_name = 'ilike'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', [*lhs_params, *rhs_params]
+
+def _postgres_suggest_queries(query, limit):
+    from django.contrib.postgres.search import TrigramSimilarity
+    from store.models import Product
+
+    pattern = connection.ops.prep_for_like_query(query)
+    brands = Product.objects.filter(ILike(F('brand'), f'{pattern}%')).values_list(
+        'brand', flat=True
+    ).distinct().order_by('brand')[:limit]
+    # Both filters are served by the gin_trgm_ops indexes; prefix hits rank first
+    names = Product.objects.filter(ILike(F('name'), f'%{pattern}%')).alias(
+        is_prefix=Case(
+            When(ILike(F('name'), f'{pattern}%'), then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        similarity=TrigramSimilarity('name', query),
+    ).order_by('-is_prefix', '-similarity', 'name').values_list('name', flat=True)[:limit * 2]
+    return brands, names
+
+def _postgres_suggest(query, limit):
+    brands, names = _postgres_suggest_queries(query, limit)
+    completions = [('brand', brand) for brand in brands]
+    completions += [('name', name) for name in dict.fromkeys(names)]
+    return completions[:limit]
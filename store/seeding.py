@@ -0,0 +1,137 @@
+"""
+Fast fixture seeding.
+
+`loaddata` deserializes a fixture into model instances and saves them one
+at a time, firing signals for every row. For seeding CI and preview
+databases, seed_fixture() parses a JSON fixture incrementally, groups the
+objects by model and writes each model with batched
+bulk_create(update_conflicts=True) inside one transaction, which sends no
+model signals. Availability summaries that the Size signals would maintain
+are computed while loading, and sequences are reset afterwards as loaddata
+does.
+
+Like loaddata, a later object with the same primary key replaces an earlier
+one and existing rows are overwritten. Unlike loaddata, auto_now and
+auto_now_add timestamps take the seeding time.
+"""
+import json
+import time
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from store import cache as catalog_cache
+from store.availability import summarize
+from store.models import Product, Size
+
+READ_SIZE = 64 * 1024
+
+def iter_json_array(stream, read_size=READ_SIZE):
+    """Yield the elements of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        # Skip whitespace and separators between elements
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise ValueError('Fixture must be a JSON array')
+            started = True
+            position += 1
+            continue
+        if started and position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            if position >= len(buffer):
+                raise ValueError
+            element, end = decoder.raw_decode(buffer, position)
+            if end == len(buffer) and not eof:
+                # A number or literal may continue in the next read
+                raise ValueError
+        except ValueError:
+            # Incomplete element: read more, unless there is nothing left
+            if eof:
+                raise ValueError('Unexpected end of fixture')
+            chunk = stream.read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield element
+        position = end
+
+def build_instance(model, pk, fields):
+    """A model instance from fixture fields, converted like the python deserializer does"""
+    values = {}
+    for name, value in fields.items():
+        field = model._meta.get_field(name)
+        if field.many_to_many:
+            raise ValueError(f'{model._meta.label}.{name}: many-to-many fields are not supported')
+        if field.is_relation:
+            values[field.attname] = field.target_field.to_python(value) if value is not None else None
+        else:
+            values[field.attname] = field.to_python(value)
+    return model(pk=model._meta.pk.to_python(pk), **values)
+
+def group_objects(records):
+    """{model: {pk: instance}} in order of first appearance; later duplicates win"""
+    grouped = {}
+    for record in records:
+        model = apps.get_model(record['model'])
+        instance = build_instance(model, record.get('pk'), record.get('fields', {}))
+        grouped.setdefault(model, {})[instance.pk] = instance
+    return grouped
+
+def apply_availability(grouped):
+    """
+    Fill in the availability summary of seeded products from seeded sizes.
+    Returns the ids of other products whose sizes were seeded.
+    """
+    products = grouped.get(Product, {})
+    sizes = {}
+    for size in grouped.get(Size, {}).values():
+        sizes.setdefault(size.product_id, []).append((size.size, size.gender, size.quantity))
+    for pk, product in products.items():
+        for field, value in summarize(sizes.get(pk, [])).items():
+            setattr(product, field, value)
+    return set(sizes) - set(products)
+
+def seed_fixture(path, using=DEFAULT_DB_ALIAS, batch_size=1000):
+    """Load a JSON fixture in bulk; returns ({model label: rows}, seconds)"""
+    start = time.monotonic()
+    with open(path, encoding='utf-8') as stream:
+        grouped = group_objects(iter_json_array(stream))
+    other_products = apply_availability(grouped)
+
+    connection = connections[using]
+    counts = {}
+    with transaction.atomic(using=using):
+        for model, objects in grouped.items():
+            objects = list(objects.values())
+            update_fields = [
+                field.name for field in model._meta.concrete_fields if not field.primary_key
+            ]
+            upsert = {
+                'update_conflicts': True,
+                'unique_fields': [model._meta.pk.name],
+                'update_fields': update_fields,
+            } if update_fields else {'ignore_conflicts': True}
+            model._base_manager.using(using).bulk_create(objects, batch_size=batch_size, **upsert)
+            counts[model._meta.label] = len(objects)
+        if other_products:
+            Product.objects.using(using).filter(pk__in=other_products).refresh_availability()
+
+        # Rows were inserted with explicit ids, so move sequences past them
+        statements = connection.ops.sequence_reset_sql(no_style(), list(grouped))
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+        connection.check_constraints(table_names=[model._meta.db_table for model in grouped])
+
+    for model in grouped:
+        catalog_cache.bump_version(model._meta.model_name)
+    return counts, time.monotonic() - start
@@ -1,11 +1,23 @@
 from .profile_serializer import ProfileSerializer, UserSerializer
-from .product_serializer import CategorySerializer, ProductSerializer
-from .order_serializer import OrderSerializer
+from .product_serializer import (
+    CategorySerializer, ProductListSerializer, ProductSerializer, SizeSerializer
+)
+from .order_serializer import (
+    AddItemSerializer, CheckoutSerializer, OrderItemSerializer, OrderListSerializer, OrderSerializer,
+    OrderSummarySerializer
+)
 
 __all__ = [
     'ProfileSerializer',
     'UserSerializer',
     'CategorySerializer',
     'ProductSerializer',
-    'OrderSerializer'
+    'ProductListSerializer',
+    'SizeSerializer',
+    'OrderSerializer',
+    'OrderListSerializer',
+    'OrderSummarySerializer',
+    'OrderItemSerializer',
+    'AddItemSerializer',
+    'CheckoutSerializer'
 ]
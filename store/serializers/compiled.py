@@ -0,0 +1,260 @@
+"""
+Read-only list serializers compiled from a ModelSerializer.
+
+Rendering a list through a ModelSerializer walks the DRF field machinery
+for every field of every row: attribute lookup with fallbacks, None checks
+and a to_representation call each. CompiledListSerializer inspects the
+fields of `serializer_class` once per process and generates a single
+function that builds each row's dict directly, with plain attribute reads
+for model fields and inlined conversions for decimals and datetimes. The
+output is identical; field types without a fast path call the field itself.
+
+Use it for list responses only; writes and detail views keep the full
+serializer.
+"""
+import decimal
+from collections.abc import Mapping
+from contextvars import ContextVar
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+
+# Serializer fields that return values of the model fields listed unchanged
+_PASSTHROUGH_FIELDS = {
+    serializers.CharField: (models.CharField, models.TextField),
+    serializers.ChoiceField: (models.CharField,),
+    serializers.EmailField: (models.CharField,),
+    serializers.IntegerField: (models.IntegerField, models.AutoField),
+    serializers.BooleanField: (models.BooleanField,),
+}
+
+_SKIP = object()
+_context = ContextVar('compiled_serializer_context', default={})
+_build_functions = {}
+
+def _is_plain_attribute(model, name):
+    try:
+        model_field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return isinstance(getattr(model, name, None), (property, cached_property))
+    return model_field.concrete and not model_field.is_relation
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.decimal_places is None:
+        return field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(exponent, rounding=field.rounding, context=context))
+    return convert
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+    def convert(value):
+        if isinstance(value, str):
+            return value
+        if field_timezone is not None and timezone.is_aware(value):
+            value = value.astimezone(field_timezone)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+def _fallback(field):
+    # Full Serializer.to_representation semantics for sources we cannot shortcut
+    def value(instance):
+        try:
+            attribute = field.get_attribute(instance)
+        except SkipField:
+            return _SKIP
+        check = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        return None if check is None else field.to_representation(attribute)
+    return value
+
+def _related_value(field, model):
+    """A function for sources such as category.name across a foreign key, or None"""
+    relation = _model_field(model, field.source_attrs[0])
+    if relation is None or not (relation.many_to_one or (relation.one_to_one and relation.concrete)):
+        return None
+    if relation.null and field.default is serializers.empty and not field.allow_null:
+        # DRF raises for a missing relation here; leave that to the field
+        return None
+    if not _is_plain_attribute(relation.related_model, field.source_attrs[1]):
+        return None
+    default = field.get_default() if field.default is not serializers.empty else None
+    first, second = field.source_attrs
+    convert = field.to_representation
+
+    def value(instance):
+        # A null relation gives the default, as the AttributeError does in DRF
+        related = getattr(instance, first)
+        value = default if related is None else getattr(related, second)
+        return None if value is None else convert(value)
+    return value
+
+def compile_field(field, model):
+    """
+    How to produce `field` for an instance of `model`, as one of
+        ('attr', name)               the attribute, unchanged
+        ('convert', name, function)  function(attribute), or None for None
+        ('call', function)           function(instance)
+        ('skippable', function)      function(instance), which may return _SKIP
+    """
+    attrs = field.source_attrs
+    if isinstance(field, serializers.SerializerMethodField):
+        return ('call', field.to_representation)
+
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and len(attrs) == 1:
+        # The raw foreign key column, without loading the related object
+        return ('attr', model._meta.get_field(field.source).attname)
+
+    if (isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer)
+            and len(attrs) == 1):
+        # Nested rows, usually a prefetched reverse relation
+        build = build_function(compile_plan(field.child))
+        source = field.source
+        relation = _model_field(model, source)
+        cache_name = relation.get_cache_name() if relation is not None and relation.is_relation else None
+
+        def items(instance):
+            # Prefetched rows are read straight from the cache, skipping the manager
+            prefetched = instance.__dict__.get('_prefetched_objects_cache', {}).get(cache_name)
+            if prefetched is not None and prefetched._result_cache is not None:
+                related = prefetched._result_cache
+            else:
+                related = getattr(instance, source)
+                if isinstance(related, models.Manager):
+                    related = related.all()
+            return list(map(build, related))
+        return ('call', items)
+
+    if len(attrs) == 2:
+        value = _related_value(field, model)
+        return ('call', value) if value is not None else ('skippable', _fallback(field))
+
+    if len(attrs) != 1 or not _is_plain_attribute(model, attrs[0]):
+        return ('skippable', _fallback(field))
+
+    source = attrs[0]
+    passthrough = _PASSTHROUGH_FIELDS.get(type(field))
+    if passthrough is not None and isinstance(_model_field(model, source), passthrough):
+        return ('attr', source)
+    if type(field) is serializers.DecimalField:
+        return ('convert', source, _decimal_converter(field))
+    if type(field) is serializers.DateTimeField:
+        return ('convert', source, _datetime_converter(field))
+    return ('convert', source, field.to_representation)
+
+def compile_plan(serializer):
+    """(name, spec) for each readable field of a ModelSerializer, see compile_field()"""
+    model = serializer.Meta.model
+    return [(field.field_name, compile_field(field, model)) for field in serializer._readable_fields]
+
+def build_function(plan):
+    """Generate a function returning the representation of one instance"""
+    if any(spec[0] == 'skippable' for _, spec in plan):
+        return _build_skipping(plan)
+
+    namespace = {}
+    items = []
+    for index, (name, spec) in enumerate(plan):
+        kind = spec[0]
+        if kind == 'attr':
+            expression = f'instance.{spec[1]}'
+        elif kind == 'convert':
+            namespace[f'convert_{index}'] = spec[2]
+            expression = f'(None if (value := instance.{spec[1]}) is None else convert_{index}(value))'
+        else:
+            namespace[f'call_{index}'] = spec[1]
+            expression = f'call_{index}(instance)'
+        items.append(f'{name!r}: {expression}')
+    source = 'def build(instance):\n    return {' + ', '.join(items) + '}\n'
+    exec(compile(source, '<compiled serializer>', 'exec'), namespace)
+    return namespace['build']
+
+def _build_skipping(plan):
+    def build(instance):
+        ret = {}
+        for name, spec in plan:
+            kind = spec[0]
+            if kind in ('attr', 'convert'):
+                value = getattr(instance, spec[1])
+                if kind == 'convert' and value is not None:
+                    value = spec[2](value)
+            else:
+                value = spec[1](instance)
+                if value is _SKIP:
+                    continue
+            ret[name] = value
+        return ret
+    return build
+
+class _ResponseContext(Mapping):
+    """The serializer context of the response being built, for compiled fields"""
+
+    def __getitem__(self, key):
+        return _context.get()[key]
+
+    def __iter__(self):
+        return iter(_context.get())
+
+    def __len__(self):
+        return len(_context.get())
+
+class CompiledManySerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        build = self.child.get_build_function()
+        token = _context.set(self.context)
+        try:
+            return list(map(build, iterable))
+        finally:
+            _context.reset(token)
+
+class CompiledListSerializer(serializers.BaseSerializer):
+    """
+    Read-only serializer with the output of `serializer_class`, built by a
+    function generated once per class. Only to_representation is supported.
+    """
+    serializer_class = None
+
+    class Meta:
+        list_serializer_class = CompiledManySerializer
+
+    @classmethod
+    def get_build_function(cls):
+        build = _build_functions.get(cls.serializer_class)
+        if build is None:
+            # Fields are bound once, reading the context of each response through _context
+            serializer = cls.serializer_class(context=_ResponseContext())
+            build = _build_functions[cls.serializer_class] = build_function(compile_plan(serializer))
+        return build
+
+    def to_representation(self, instance):
+        token = _context.set(self.context)
+        try:
+            return self.get_build_function()(instance)
+        finally:
+            _context.reset(token)
@@ -1,7 +1,62 @@
 from rest_framework import serializers
-from store.models import Order
+from store.models import Order, OrderItem, Size
+from store.serializers.compiled import CompiledListSerializer
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    size_label = serializers.CharField(source='size.size', read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'order', 'product', 'product_name', 'size', 'size_label', 'quantity', 'price']
+        read_only_fields = ['order', 'product', 'price']
 
 class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+
     class Meta:
         model = Order
         fields = '__all__'
+        # The total is computed from the items on the server (store.order_totals)
+        read_only_fields = ['user', 'total_amount']
+
+class OrderListSerializer(CompiledListSerializer):
+    """OrderSerializer output for list responses, without the per-row field machinery"""
+    serializer_class = OrderSerializer
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """Order history rows with item aggregates computed in SQL (OrderQuerySet.with_summary)"""
+    item_count = serializers.IntegerField(read_only=True)
+    items_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'created_at', 'status', 'total_amount', 'item_count', 'items_total']
+
+class AddItemSerializer(serializers.Serializer):
+    size = serializers.PrimaryKeyRelatedField(queryset=Size.objects.select_related('product'))
+    product = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+    def validate(self, attrs):
+        if 'product' in attrs and attrs['product'] != attrs['size'].product_id:
+            raise serializers.ValidationError({'size': 'Size does not belong to this product.'})
+        return attrs
+
+class RemoveItemSerializer(serializers.Serializer):
+    item = serializers.IntegerField()
+
+class CartLineSerializer(serializers.Serializer):
+    size = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+class CheckoutSerializer(serializers.Serializer):
+    shipping_address = serializers.CharField()
+    items = CartLineSerializer(many=True, allow_empty=False, max_length=100)
+
+    def validate_items(self, items):
+        """Merge repeated sizes into one line each, keyed by size id"""
+        quantities = {}
+        for line in items:
+            quantities[line['size']] = quantities.get(line['size'], 0) + line['quantity']
+        return quantities
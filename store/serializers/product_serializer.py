@@ -1,12 +1,31 @@
 from rest_framework import serializers
-from store.models import Category, Product
+from store.models import Category, Product, Size
+from store.serializers.compiled import CompiledListSerializer
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
+class SizeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Size
+        fields = ['id', 'size', 'gender', 'quantity']
+
 class ProductSerializer(serializers.ModelSerializer):
+    category_name = serializers.CharField(source='category.name', read_only=True, default=None)
+    sizes = SizeSerializer(many=True, read_only=True)
+    available_stock = serializers.IntegerField(source='total_stock', read_only=True)
+    available_sizes = serializers.DictField(read_only=True)
+
     class Meta:
         model = Product
-        fields = '__all__'
+        # total_stock and in_stock_sizes are exposed as available_stock and,
+        # parsed, available_sizes; rating_sum is internal
+        exclude = ['total_stock', 'in_stock_sizes', 'rating_sum']
+        # Maintained by ProductQuerySet.add_rating()
+        read_only_fields = ['rating', 'review_count']
+
+class ProductListSerializer(CompiledListSerializer):
+    """ProductSerializer output for list responses, without the per-row field machinery"""
+    serializer_class = ProductSerializer
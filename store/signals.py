@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile
+from . import cache as catalog_cache
+from . import filter_index
+from .models import Category, Product, Profile, Size
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -16,3 +19,41 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
     except Profile.DoesNotExist:
         Profile.objects.create(user=instance)
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Size)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Size)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, instance, signal, **kwargs):
+    """
+    Bump the catalog cache version of the changed model and reload the
+    changed product into the catalog filter index, once committed
+    """
+    model_name = sender._meta.model_name
+    if sender is not Category:
+        product_ids = [instance.pk if sender is Product else instance.product_id]
+    elif signal is post_save:
+        product_ids = []
+    else:
+        # Deleting a category updates its products in SQL, so that is left to
+        # the filter index's version check, which rebuilds it
+        product_ids = None
+
+    def changed():
+        version = catalog_cache.bump_version(model_name)
+        if product_ids is not None:
+            filter_index.catalog_changed(model_name, product_ids, version)
+
+    # Bumping before the commit would let another request cache the old rows
+    # under the new version
+    transaction.on_commit(changed)
+
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+def refresh_product_availability(sender, instance, raw=False, **kwargs):
+    """Keep the product's availability summary in step with its sizes"""
+    # Fixture loads skip this; run rebuild_availability afterwards
+    if not raw:
+        Product.objects.filter(pk=instance.product_id).refresh_availability()
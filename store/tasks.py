@@ -0,0 +1,40 @@
+"""
+Background tasks run by `manage.py run_worker` (see store.jobs)
+"""
+import logging
+from django.conf import settings
+from django.core.mail import mail_admins, send_mail
+from store import jobs
+from store.models import Order, Size
+
+logger = logging.getLogger(__name__)
+
+@jobs.task('orders.send_confirmation')
+def send_order_confirmation(order_id):
+    """Email the customer a summary of a placed order"""
+    order = Order.objects.select_related('user').with_items().get(pk=order_id)
+    if not order.user.email:
+        return
+    lines = [
+        f"{item.quantity}x {item.product.name} ({item.size.size}) - ${item.line_total}"
+        for item in order.items.all()
+    ]
+    send_mail(
+        f"Order #{order.pk} confirmed",
+        "\n".join([f"Thanks for your order, {order.user.username}!", "", *lines, "",
+                   f"Total: ${order.total_amount}", f"Shipping to: {order.shipping_address}"]),
+        None,
+        [order.user.email],
+    )
+
+@jobs.task('stock.low_stock_alert')
+def alert_low_stock(size_ids):
+    """Tell the admins which of the given sizes are at or below LOW_STOCK_THRESHOLD"""
+    threshold = getattr(settings, 'LOW_STOCK_THRESHOLD', 2)
+    sizes = Size.objects.select_related('product').filter(pk__in=size_ids, quantity__lte=threshold)
+    lines = [f"{size.product.name} {size.size} ({size.gender}): {size.quantity} left" for size in sizes]
+    if not lines:
+        # Restocked since the job was queued
+        return
+    logger.warning(f"Low stock: {'; '.join(lines)}")
+    mail_admins("Low stock", "\n".join(lines))
@@ -1,3 +1,1192 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.db import connection, connections, transaction
+from io import StringIO
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.management import CommandError, call_command
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock, skipUnless
+from rest_framework.test import APIClient
+from . import cache as catalog_cache, filter_index, jobs, order_totals
+from .db_router import PrimaryReplicaRouter, is_pinned_to_primary, pin_to_primary, replica_reads
+from .facets import filter_conditions, parse_filters
+from .log_handlers import LazyFileHandler, QueueLogHandler
+from .models import Category, Job, Order, OrderItem, Product, Size
 
 # Create your tests here.
+
+def create_product(name, category=None, price='100.00', sizes=(('US 9', 'M', 5),)):
+    product = Product.objects.create(
+        name=name, description=f'{name} description', price=price, category=category
+    )
+    for size, gender, quantity in sizes:
+        Size.objects.create(product=product, size=size, gender=gender, quantity=quantity)
+    return product
+
+class ProductListQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Running')
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_is_independent_of_page_length(self):
+        create_product('Solo', self.category)
+        single = self.count_list_queries()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(11):
+                create_product(f'Runner {i}', self.category, sizes=(('US 8', 'M', 1), ('US 9', 'W', 0)))
+        full_page = self.count_list_queries()
+
+        self.assertEqual(single, full_page)
+
+    def test_list_includes_sizes_category_and_stock(self):
+        create_product('Runner', self.category, sizes=(('US 8', 'M', 3), ('US 9', 'W', 4)))
+        response = self.client.get('/api/products/')
+        product = response.json()['results'][0]
+        self.assertEqual(product['category_name'], 'Running')
+        self.assertEqual(product['available_stock'], 7)
+        self.assertNotIn('total_stock', product)
+        self.assertEqual([size['size'] for size in product['sizes']], ['US 8', 'US 9'])
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = create_product('Runner')
+
+    def test_repeated_list_is_served_from_cache(self):
+        self.client.get('/api/products/?ordering=name')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/?ordering=name')
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_pages_are_cached_per_origin(self):
+        for i in range(12):
+            create_product(f'Trainer {i}', sizes=())
+        self.client.get('/api/products/', HTTP_HOST='internal:8000')
+        response = self.client.get('/api/products/', HTTP_HOST='shop.example.com', secure=True)
+        self.assertTrue(response.json()['next'].startswith('https://shop.example.com/api/products/'))
+
+    def test_size_change_invalidates_product_pages(self):
+        self.client.get('/api/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Size.objects.filter(product=self.product).get().delete()
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.json()['results'][0]['sizes'], [])
+
+    def test_version_is_bumped_once_the_save_commits(self):
+        version = catalog_cache.get_version('product')
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                self.product.name = 'Trainer'
+                self.product.save()
+            # Other requests still read the old row, so it keeps the old version
+            self.assertEqual(catalog_cache.get_version('product'), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(catalog_cache.get_version('product'), version)
+        self.assertEqual(self.client.get('/api/products/').json()['results'][0]['name'], 'Trainer')
+
+    def test_category_pages_ignore_product_changes(self):
+        Category.objects.create(name='Running')
+        self.client.get('/api/categories/')
+        create_product('Trainer')
+        with self.assertNumQueries(0):
+            self.client.get('/api/categories/')
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = create_product('Runner')
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get('/api/products/')['ETag']
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_change_issues_new_etag(self):
+        etag = self.client.get(f'/api/products/{self.product.pk}/')['ETag']
+        self.product.name = 'Trainer'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get(f'/api/products/{self.product.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unchanged_categories_honour_if_modified_since(self):
+        Category.objects.create(name='Running')
+        last_modified = self.client.get('/api/categories/')['Last-Modified']
+        response = self.client.get('/api/categories/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_pages_send_no_last_modified(self):
+        # Stock changes do not touch Product.updated_at, so it cannot vouch for the page
+        response = self.client.get(f'/api/products/{self.product.pk}/')
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('ETag', response)
+
+    def test_malformed_key_is_not_found(self):
+        self.assertEqual(self.client.get('/api/products/abc/').status_code, 404)
+        self.assertEqual(self.client.get('/api/categories/abc/').status_code, 404)
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        # Shared prices force the id tie-breaker across page boundaries
+        for i in range(30):
+            create_product(f'Runner {i:02d}', price=f'{50 + i % 4}.00', sizes=())
+
+    def walk(self, url):
+        ids, pages = [], []
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data)
+            ids.extend(product['id'] for product in data['results'])
+            url = data['next']
+        return ids, pages
+
+    def test_walk_visits_every_product_once_in_order(self):
+        ids, pages = self.walk('/api/products/?paginate=cursor&ordering=-price')
+        expected = list(
+            Product.objects.order_by('-price', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), 3)
+        self.assertNotIn('count', pages[0])
+
+    def test_previous_link_returns_to_earlier_page(self):
+        first = self.client.get('/api/products/?paginate=cursor&ordering=price').json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(first['previous'])
+
+    def test_cursor_page_skips_count_query(self):
+        first = self.client.get('/api/products/?paginate=cursor').json()
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first['next'])
+        self.assertFalse(any('COUNT(*)' in query['sql'] for query in queries))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/products/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_value_is_rejected(self):
+        for value in ('xyz', None, 'NaN'):
+            token = base64.urlsafe_b64encode(json.dumps({'value': value, 'id': 1}).encode()).decode()
+            response = self.client.get(f'/api/products/?paginate=cursor&ordering=price&cursor={token}')
+            self.assertEqual(response.status_code, 404, value)
+
+    def test_out_of_range_cursor_id_is_rejected(self):
+        for pk in (10 ** 30, -10 ** 30):
+            token = base64.urlsafe_b64encode(json.dumps({'value': '50.00', 'id': pk}).encode()).decode()
+            response = self.client.get(f'/api/products/?paginate=cursor&ordering=price&cursor={token}')
+            self.assertEqual(response.status_code, 404, pk)
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        create_product('Trail Runner')
+        create_product('Court Classic')
+        trainer = create_product('Daily Trainer')
+        trainer.description = 'Built for running errands'
+        trainer.save()
+
+    def search(self, query):
+        response = self.client.get('/api/products/', {'search': query})
+        return [product['name'] for product in response.json()['results']]
+
+    def test_prefix_terms_match_name_and_description(self):
+        self.assertEqual(self.search('run'), ['Trail Runner', 'Daily Trainer'])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('trail run'), ['Trail Runner'])
+
+    def test_blank_query_returns_everything(self):
+        self.assertEqual(len(self.search('  ')), 3)
+
+class ProductSuggestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        for name, brand in [('Nike Air Runner', 'Nike'), ('Nimbus Trainer', 'Asics'), ('Trail Runner', 'Nike')]:
+            product = create_product(name, sizes=())
+            product.brand = brand
+            product.save()
+
+    def suggest(self, query):
+        response = self.client.get('/api/products/suggest/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['value']) for item in response.json()['suggestions']]
+
+    def test_brands_rank_before_names(self):
+        self.assertEqual(
+            self.suggest('ni'),
+            [('brand', 'Nike'), ('name', 'Nimbus Trainer'), ('name', 'Nike Air Runner')],
+        )
+
+    def test_word_prefixes_complete_names(self):
+        self.assertEqual(self.suggest('runn'), [('name', 'Nike Air Runner'), ('name', 'Trail Runner')])
+
+    def test_new_products_are_suggested(self):
+        self.suggest('pu')
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product('Puma Suede', sizes=())
+        self.assertEqual(self.suggest('pu'), [('name', 'Puma Suede')])
+
+    def test_postgres_filters_can_use_the_trigram_indexes(self):
+        from django.db.backends.postgresql.base import DatabaseWrapper
+        from . import search
+        postgres = DatabaseWrapper({**settings.DATABASES['default'], 'ENGINE': 'django.db.backends.postgresql'})
+        with mock.patch.object(search, 'connection', postgres):
+            brands, names = search._postgres_suggest_queries('ni_', 8)
+        for queryset, column in ((brands, 'brand'), (names, 'name')):
+            sql, params = queryset.query.get_compiler(connection=postgres).as_sql()
+            # UPPER("name"::text) LIKE ... would bypass the gin_trgm_ops index on the bare column
+            self.assertIn(f'WHERE "store_product"."{column}" ILIKE', sql)
+            self.assertNotIn('UPPER', sql)
+        self.assertIn('%ni\\_%', params)
+
+class CatalogFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.running = Category.objects.create(name='Running')
+        self.trail = Category.objects.create(name='Trail')
+        for name, category, brand, price, sizes in [
+            ('Pegasus', self.running, 'Nike', '120.00', (('US 9', 'M', 2), ('US 10', 'M', 1))),
+            ('Vomero', self.running, 'Nike', '160.00', (('US 10', 'M', 0), ('US 7', 'W', 3))),
+            ('Speedgoat', self.trail, 'Hoka', '155.00', (('US 10', 'M', 4),)),
+            ('Clifton', self.running, 'Hoka', '45.00', (('US 9', 'M', 1),)),
+        ]:
+            product = create_product(name, category, price=price, sizes=sizes)
+            Product.objects.filter(pk=product.pk).update(brand=brand)
+
+    def get_facets(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/products/facets/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        data = response.json()
+        return data['count'], {
+            facet: {entry['label']: entry['count'] for entry in entries}
+            for facet, entries in data['facets'].items()
+        }
+
+    def test_counts_for_the_whole_catalog(self):
+        count, facets = self.get_facets()
+        self.assertEqual(count, 4)
+        self.assertEqual(facets['category'], {'Running': 3, 'Trail': 1})
+        self.assertEqual(facets['brand'], {'Nike': 2, 'Hoka': 2})
+        self.assertEqual(facets['size'], {'US 7': 1, 'US 9': 2, 'US 10': 2})
+        self.assertEqual(facets['price'], {'0-50': 1, '100-150': 1, '150-200': 2})
+
+    def test_each_facet_ignores_its_own_filter(self):
+        count, facets = self.get_facets('brand=nike&in_stock_size=10&gender=M')
+        self.assertEqual(count, 1)
+        # Other brands stay selectable, counted under the size filter
+        self.assertEqual(facets['brand'], {'Nike': 1, 'Hoka': 1})
+        self.assertEqual(facets['size'], {'US 9': 1, 'US 10': 1})
+        self.assertEqual(facets['category'], {'Running': 1})
+
+    def test_list_applies_the_same_filters(self):
+        response = self.client.get(f'/api/products/?category={self.running.pk}&min_price=100&max_price=160')
+        self.assertEqual([product['name'] for product in response.json()['results']], ['Pegasus', 'Vomero'])
+        response = self.client.get('/api/products/?min_price=cheap')
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_category_id_is_rejected(self):
+        for url in ('/api/products/', '/api/products/facets/'):
+            response = self.client.get(f'{url}?category=99999999999999999999999')
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('category', response.json())
+
+@override_settings(CATALOG_FILTER_INDEX=True)
+class FilterIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        filter_index.reset()
+        self.addCleanup(filter_index.reset)
+        self.client = APIClient()
+        self.running = Category.objects.create(name='Running')
+        for i, (brand, price, sizes) in enumerate([
+            ('Nike', '120.00', (('US 9', 'M', 2), ('US 10', 'M', 1))),
+            ('Nike', '160.00', (('US 10', 'M', 0), ('US 7', 'W', 3))),
+            ('Hoka', '155.00', (('US 10', 'M', 4),)),
+            ('Hoka', '45.00', (('US 9', 'W', 1),)),
+        ]):
+            product = create_product(f'Shoe {i}', self.running if i % 2 else None, price=price, sizes=sizes)
+            Product.objects.filter(pk=product.pk).update(brand=brand, rating=i + 1)
+
+    def list_names(self, query):
+        response = self.client.get(f'/api/products/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()['results']]
+
+    def test_matches_sql_filters(self):
+        queries = [
+            'brand=NIKE', 'brand=nike&brand=hoka&gender=W', 'in_stock_size=10',
+            'in_stock_size=10&gender=M&min_price=150', f'category={self.running.pk}&min_rating=3',
+            'min_price=45&max_price=120', 'max_price=44.99', 'gender=M&min_rating=2.5',
+        ]
+        for query in queries:
+            with self.subTest(query=query):
+                spec = parse_filters(QueryDict(query))
+                expected = Product.objects.order_by('pk')
+                for condition in filter_conditions(spec).values():
+                    expected = expected.filter(condition)
+                self.assertEqual(filter_index.match(spec), list(expected.values_list('pk', flat=True)))
+        self.assertEqual(self.list_names('brand=hoka&in_stock_size=9'), ['Shoe 3'])
+
+    def test_own_changes_update_the_index_in_place(self):
+        self.assertEqual(self.list_names('in_stock_size=11'), [])
+        index = filter_index.get_filter_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            Size.objects.create(product=Product.objects.get(name='Shoe 2'), size='US 11', gender='M', quantity=1)
+        self.assertEqual(self.list_names('in_stock_size=11'), ['Shoe 2'])
+        self.assertIs(filter_index.get_filter_index(), index)
+
+    def test_reload_reads_the_database_without_blocking_matches(self):
+        filter_index.get_filter_index()
+        fetch = filter_index._fetch
+        lock_free = []
+
+        def fetch_checking_lock(ids):
+            # match() in another thread must not wait while the rows are read
+            def try_lock():
+                acquired = filter_index._lock.acquire(timeout=1)
+                lock_free.append(acquired)
+                if acquired:
+                    filter_index._lock.release()
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+            return fetch(ids)
+
+        with mock.patch.object(filter_index, '_fetch', fetch_checking_lock):
+            with self.captureOnCommitCallbacks(execute=True):
+                Size.objects.create(product=Product.objects.get(name='Shoe 2'), size='US 11', gender='M', quantity=1)
+        self.assertEqual(lock_free, [True])
+        self.assertEqual(self.list_names('in_stock_size=11'), ['Shoe 2'])
+
+    def test_changes_published_by_other_processes_are_applied_in_place(self):
+        index = filter_index.get_filter_index()
+        shoe = Product.objects.get(name='Shoe 0')
+        # As another process's checkout or rating would: write, bump, publish
+        Product.objects.filter(pk=shoe.pk).update(brand='Asics')
+        filter_index.publish_changes('product', catalog_cache.bump_version('product'), [shoe.pk])
+        with mock.patch.object(filter_index, '_rebuild', side_effect=AssertionError('full rebuild')):
+            self.assertEqual(self.list_names('brand=asics'), ['Shoe 0'])
+        self.assertIs(filter_index.get_filter_index(), index)
+
+    def test_changes_made_elsewhere_rebuild_the_index(self):
+        index = filter_index.get_filter_index()
+        Product.objects.filter(name='Shoe 0').update(brand='Asics')
+        catalog_cache.bump_version('product')
+        self.assertEqual(self.list_names('brand=asics'), ['Shoe 0'])
+        self.assertIsNot(filter_index.get_filter_index(), index)
+
+    @override_settings(CATALOG_FILTER_INDEX_MAX_BYTES=1000)
+    def test_falls_back_to_sql_over_the_memory_limit(self):
+        with self.assertLogs('store.filter_index', 'WARNING'):
+            self.assertIsNone(filter_index.match({'brand': ['nike']}))
+        self.assertEqual(self.list_names('brand=nike'), ['Shoe 0', 'Shoe 1'])
+
+class RateProductTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('rater', password='pass'))
+        self.product = create_product('Runner')
+
+    def rate(self, rating, pk=None):
+        return self.client.post(f'/api/products/{pk or self.product.pk}/rate_product/', {'rating': rating})
+
+    def test_ratings_fold_into_running_average(self):
+        for rating in (5, 4, 4):
+            self.assertEqual(self.rate(rating).status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 3)
+        self.assertEqual(str(self.product.rating), '4.33')
+        self.assertEqual(str(self.product.rating_sum), '13.00')
+
+    def test_out_of_range_rating_is_rejected(self):
+        self.assertEqual(self.rate(6).status_code, 400)
+        self.assertEqual(self.rate('great').status_code, 400)
+
+    def test_unknown_product_is_not_found(self):
+        self.assertEqual(self.rate(3, pk=999).status_code, 404)
+
+    def test_rating_fields_are_read_only(self):
+        response = self.client.patch(f'/api/products/{self.product.pk}/', {
+            'rating_sum': '999', 'rating': '5', 'review_count': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('rating_sum', response.json())
+        self.rate(4)
+        self.product.refresh_from_db()
+        self.assertEqual((str(self.product.rating), self.product.review_count), ('4.00', 1))
+
+@mock.patch('store.db_router.replica_configured', return_value=True)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.user = User.objects.create_user('writer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = create_product('Runner')
+
+    def test_reads_go_to_replica_only_when_enabled(self, _):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Product), 'replica')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_writes_always_go_to_primary(self, _):
+        self.product._state.db = 'replica'
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Product, instance=self.product), 'default')
+
+    def test_successful_write_pins_user_to_primary(self, _):
+        self.assertFalse(is_pinned_to_primary(self.user))
+        self.client.post(f'/api/products/{self.product.pk}/rate_product/', {'rating': 6})
+        self.assertFalse(is_pinned_to_primary(self.user))
+        response = self.client.post(f'/api/products/{self.product.pk}/rate_product/', {'rating': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_pinned_to_primary(self.user))
+        # Pinned, so this read is served by the primary (no replica alias exists in tests)
+        self.assertEqual(self.client.get('/api/products/').status_code, 200)
+
+    def test_pin_check_skips_the_cache_without_a_replica(self, replica_configured):
+        replica_configured.return_value = False
+        with mock.patch('store.db_router.cache') as pin_cache:
+            self.assertFalse(is_pinned_to_primary(self.user))
+        pin_cache.get.assert_not_called()
+
+@skipUnless(connection.vendor == 'sqlite', 'uses a second SQLite file as the replica')
+class ReplicaDatabaseTests(TestCase):
+    """Routing against a real `replica` alias, a separate SQLite file with different rows"""
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        replica = dict(connections['default'].settings_dict, NAME=os.path.join(tmp.name, 'replica.sqlite3'))
+        patcher = mock.patch.dict(settings.DATABASES, {'replica': replica})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.drop_replica_connection)
+        with connections['replica'].schema_editor() as editor:
+            for model in (Category, Product, Size):
+                editor.create_model(model)
+
+        create_product('Primary shoe')
+        Product.objects.using('replica').create(name='Replica shoe', description='', price='10.00')
+        self.user = User.objects.create_user('writer', password='pass')
+        self.client = APIClient()
+
+    def drop_replica_connection(self):
+        connections['replica'].close()
+        del connections['replica']
+
+    def list_names(self):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get('/api/products/')
+        names = [product['name'] for product in response.json()['results']]
+        served = {alias for alias, queries in (('default', primary), ('replica', replica))
+                  if any('store_product' in query['sql'] for query in queries)}
+        return names, served
+
+    def test_anonymous_reads_are_served_by_the_replica(self):
+        self.assertEqual(self.list_names(), (['Replica shoe'], {'replica'}))
+
+    def test_pinned_user_reads_from_the_primary(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.list_names(), (['Replica shoe'], {'replica'}))
+        cache.clear()
+        pin_to_primary(self.user)
+        self.assertEqual(self.list_names(), (['Primary shoe'], {'default'}))
+
+    def test_replica_reads_right_after_a_change_are_not_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product('New shoe')
+        # Another user's read from the lagging replica must not fill the shared cache
+        self.assertEqual(APIClient().get('/api/products/').json()['count'], 1)
+        self.client.force_authenticate(self.user)
+        pin_to_primary(self.user)
+        names, served = self.list_names()
+        self.assertEqual((names, served), (['New shoe', 'Primary shoe'], {'default'}))
+
+    def test_suggestions_right_after_a_change_are_not_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product('New shoe')
+        response = APIClient().get('/api/products/suggest/', {'q': 'new'})
+        self.assertEqual(response.json()['suggestions'], [])
+        self.client.force_authenticate(self.user)
+        pin_to_primary(self.user)
+        response = self.client.get('/api/products/suggest/', {'q': 'new'})
+        self.assertEqual(response.json()['suggestions'], [{'type': 'name', 'value': 'New shoe'}])
+
+    def test_writes_go_to_the_primary(self):
+        self.client.force_authenticate(self.user)
+        product = Product.objects.get(name='Primary shoe')
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.post(f'/api/products/{product.pk}/rate_product/', {'rating': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica.captured_queries, [])
+        self.assertEqual(Product.objects.get(pk=product.pk).review_count, 1)
+
+class AvailabilitySummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product(
+            'Runner', sizes=(('US 9', 'M', 2), ('US 10', 'M', 0), ('US 7.5', 'W', 4))
+        )
+
+    def test_summary_follows_size_changes(self):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 6)
+        self.assertEqual(self.product.available_sizes, {'M': ['US 9'], 'W': ['US 7.5']})
+        self.assertEqual((str(self.product.min_size), str(self.product.max_size)), ('7.5', '9.0'))
+
+        Size.objects.create(product=self.product, size='US 11', gender='M', quantity=1)
+        self.product.sizes.get(size='US 9').delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 5)
+        self.assertEqual(self.product.available_sizes, {'M': ['US 11'], 'W': ['US 7.5']})
+
+    def test_reservations_refresh_summary(self):
+        from .inventory import reserve_stock, reserve_stock_bulk
+        size = self.product.sizes.get(size='US 9')
+        # Depending on the backend the summary is refreshed in the transaction or after it commits
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(size.pk, 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 4)
+        self.assertEqual(self.product.available_sizes, {'W': ['US 7.5']})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock_bulk({self.product.sizes.get(size='US 7.5').pk: 4})
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.total_stock, self.product.in_stock_sizes), (0, ''))
+        self.assertIsNone(self.product.min_size)
+
+    def test_reservation_leaves_product_row_alone_until_commit(self):
+        from .inventory import reserve_stock
+        size = self.product.sizes.get(size='US 9')
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            with CaptureQueriesContext(connection) as queries, \
+                    self.captureOnCommitCallbacks() as callbacks:
+                reserve_stock(size.pk, 2)
+            self.assertFalse(any('store_product' in query['sql'] for query in queries))
+            for callback in callbacks:
+                callback()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 4)
+
+    def test_in_stock_size_filter(self):
+        create_product('Trainer', sizes=(('US 10', 'M', 1),))
+        def names(query):
+            return [p['name'] for p in self.client.get(f'/api/products/?{query}').json()['results']]
+        self.assertEqual(names('in_stock_size=10'), ['Trainer'])
+        self.assertEqual(names('in_stock_size=US 7.5'), ['Runner'])
+        self.assertEqual(names('in_stock_size=7.5&gender=M'), [])
+        self.assertEqual(names('in_stock_size=1'), [])
+
+    def test_rebuild_command_repairs_summaries(self):
+        Product.objects.update(total_stock=0, in_stock_sizes='')
+        out = StringIO()
+        call_command('rebuild_availability', stdout=out)
+        self.assertIn('Refreshed availability for 1 products', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 6)
+
+class CatalogExportTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Running')
+        for i in range(5):
+            create_product(f'Runner {i}', self.category, sizes=(('US 9', 'M', i), ('US 8', 'W', 1)))
+        self.client = APIClient()
+
+    def test_export_command_writes_one_line_per_product(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'catalog.ndjson.gz')
+            call_command('export_catalog', output=path, chunk_size=2, stderr=StringIO())
+            with gzip.open(path, 'rt') as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual([r['name'] for r in records], [f'Runner {i}' for i in range(5)])
+        self.assertEqual(records[3]['category'], 'Running')
+        self.assertEqual(records[3]['price'], '100.00')
+        self.assertEqual(records[3]['total_stock'], 4)
+        self.assertEqual([s['gender'] for s in records[3]['sizes']], ['M', 'W'])
+
+    def test_export_endpoint_streams_for_staff_only(self):
+        self.assertEqual(self.client.get('/api/products/export/').status_code, 401)
+        self.client.force_authenticate(User.objects.create_user('feed', password='pass', is_staff=True))
+
+        response = self.client.get('/api/products/export/')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 5)
+
+        response = self.client.get('/api/products/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(body.splitlines(), lines)
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write_feed(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def import_catalog(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_upserts_on_sku(self):
+        existing = create_product('Old name', sizes=(('US 9', 'M', 1),))
+        Product.objects.filter(pk=existing.pk).update(sku='RUN-1')
+        path = self.write_feed('feed.csv', (
+            'sku,name,description,brand,category,price,sizes\n'
+            'RUN-1,Runner,Fast,Acme,Running,120.50,M:US 9=4;M:10=2\n'
+            'RUN-2,Trainer,,Acme,Training,80,W:7=3\n'
+            ',Missing sku,,,,10,\n'
+        ))
+        out, err = self.import_catalog(path, chunk_size=2)
+
+        self.assertIn('Imported 2 products from 3 records', out)
+        self.assertIn('Record 3: sku is required', err)
+        runner = Product.objects.get(sku='RUN-1')
+        self.assertEqual((runner.pk, runner.name, str(runner.price)), (existing.pk, 'Runner', '120.50'))
+        self.assertEqual(runner.category.name, 'Running')
+        self.assertEqual(
+            sorted(runner.sizes.values_list('size', 'quantity')), [('US 10', 2), ('US 9', 4)]
+        )
+        self.assertEqual(runner.total_stock, 6)
+        self.assertEqual(Product.objects.get(sku='RUN-2').available_sizes, {'W': ['US 7']})
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_import_resumes_from_checkpoint(self):
+        lines = [
+            json.dumps({'sku': f'SKU-{i}', 'name': f'Shoe {i}', 'price': '50', 'sizes': []})
+            for i in range(5)
+        ]
+        path = self.write_feed('feed.ndjson', '\n'.join(lines[:4] + ['{broken'] + lines[4:]) + '\n')
+        with self.assertRaises(CommandError):
+            self.import_catalog(path, chunk_size=2, max_errors=0)
+        self.assertEqual(Product.objects.count(), 4)
+
+        out, _ = self.import_catalog(path, chunk_size=2)
+        self.assertIn('Resuming after record 4', out)
+        self.assertEqual(Product.objects.count(), 5)
+
+    def test_malformed_values_are_counted_as_invalid(self):
+        records = [
+            {'sku': 'A', 'name': 'Shoe', 'price': 'NaN'},
+            {'sku': 'B', 'name': 'Shoe', 'price': '123456789'},
+            {'sku': 'C', 'name': 'Shoe', 'price': '50', 'sizes': 'M:9=1'},
+            {'sku': 'D', 'name': 'Shoe', 'price': '50', 'sizes': ['M:9=1']},
+            {'sku': 'E', 'name': 'Shoe', 'price': '50'},
+        ]
+        path = self.write_feed('feed.ndjson', '\n'.join(map(json.dumps, records)) + '\n')
+        out, err = self.import_catalog(path)
+        self.assertIn('Imported 1 products from 5 records', out)
+        self.assertEqual(err.count('Record'), 4)
+
+class SeedFixtureTests(TestCase):
+    def test_streaming_parser_handles_split_reads(self):
+        from .seeding import iter_json_array
+        data = json.dumps([{'pk': i, 'name': f'x{i}'} for i in range(50)] + [12345])
+        self.assertEqual(list(iter_json_array(StringIO(data), read_size=7)), json.loads(data))
+
+    def test_seed_initial_data(self):
+        out = StringIO()
+        call_command('seed_fixture', stdout=out)
+        self.assertIn('store.Product: 100 rows', out.getvalue())
+        self.assertEqual(Product.objects.count(), 100)
+        product = Product.objects.get(pk=1)
+        self.assertEqual(product.total_stock, sum(product.sizes.values_list('quantity', flat=True)))
+
+        # Seeding again overwrites rather than duplicating, and sequences moved past the ids
+        call_command('seed_fixture', stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 100)
+        self.assertEqual(create_product('New').pk, 101)
+
+class ORJSONRendererTests(TestCase):
+    def test_output_matches_stdlib_renderer(self):
+        import datetime
+        import uuid
+        from decimal import Decimal
+        from django.utils import timezone
+        from django.utils.translation import gettext_lazy
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import ORJSONRenderer
+        data = {
+            'aware': timezone.now(),
+            'offset': datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=5))),
+            'naive': datetime.datetime(2024, 5, 1, 12, 30, 0, 1500),
+            'date': datetime.date(2024, 5, 1),
+            'price': Decimal('129.99'),
+            'id': uuid.uuid4(),
+            'text': 'Caf\u00e9 \u2028 "quoted" \n \x01',
+            'lazy': gettext_lazy('Not found.'),
+            'nested': [{1: 2.5, 'none': None, 'flag': True}],
+        }
+        expected = JSONRenderer().render(data)
+        self.assertEqual(ORJSONRenderer().render(data), expected)
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4'),
+        )
+        self.assertEqual(ORJSONRenderer().render({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+
+    def test_api_parses_and_renders_json(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('rater', password='pass'))
+        product = create_product('Runner')
+        response = client.post(
+            f'/api/products/{product.pk}/rate_product/', b'{"rating": 4}', content_type='application/json'
+        )
+        self.assertEqual(response.content, b'{"success":"Rating added successfully","rating":4.0,"review_count":1}')
+        response = client.post(
+            f'/api/products/{product.pk}/rate_product/', b'{"rating": NaN', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+class CompiledListSerializerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def assertListMatchesSerializer(self, url, serializer_class, queryset):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        rows = rows['results'] if isinstance(rows, dict) else rows
+        request = response.wsgi_request
+        expected = json.loads(json.dumps(
+            serializer_class(queryset, many=True, context={'request': request}).data,
+            cls=DjangoJSONEncoder,
+        ))
+        self.assertEqual(
+            {row['id']: row for row in rows}, {row['id']: row for row in expected}
+        )
+
+    def test_product_list_matches_product_serializer(self):
+        from .serializers import ProductSerializer
+        category = Category.objects.create(name='Running')
+        create_product('Runner', category, price='129.90', sizes=(('US 9', 'M', 3), ('US 7.5', 'W', 2)))
+        create_product('Sold out', sizes=(('US 10', 'M', 0),))
+        pictured = create_product('Pictured', category, sizes=())
+        Product.objects.filter(pk=pictured.pk).update(image='products/pictured.jpg', sku='PIC-1')
+
+        self.assertListMatchesSerializer(
+            '/api/products/', ProductSerializer, Product.objects.with_catalog_data()
+        )
+
+    def test_order_list_matches_order_serializer(self):
+        from .serializers import OrderSerializer
+        user = User.objects.create_user('buyer', password='pass')
+        Order.objects.create(user=user, shipping_address='1 Main St', total_amount='59.50')
+        Order.objects.create(user=user, shipping_address='', status='S', total_amount=0)
+        self.client.force_authenticate(user)
+
+        self.assertListMatchesSerializer('/api/orders/', OrderSerializer, Order.objects.all())
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.size = create_product('Runner', price='40.00', sizes=(('US 9', 'M', 50),)).sizes.get()
+
+    def place_order(self, lines, user=None):
+        order = Order.objects.create(user=user or self.user, shipping_address='1 Main St', total_amount=0)
+        for quantity in lines:
+            OrderItem.objects.create(
+                order=order, product=self.size.product, size=self.size, quantity=quantity, price='40.00'
+            )
+        return order
+
+    def count_list_queries(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/orders/{query}')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()['results']
+
+    def test_list_loads_items_in_a_fixed_number_of_queries(self):
+        self.place_order([1])
+        single, _ = self.count_list_queries()
+        for _ in range(5):
+            self.place_order([1, 2, 3])
+        full, orders = self.count_list_queries()
+        self.assertEqual(single, full)
+        self.assertEqual(len(orders), 6)
+        item = orders[0]['items'][0]
+        self.assertEqual((item['product_name'], item['size_label']), ('Runner', 'US 9'))
+
+    def test_summary_aggregates_items_in_sql(self):
+        self.place_order([])
+        order = self.place_order([1, 2])
+        queries, orders = self.count_list_queries('?view=summary')
+        summary = {row['id']: row for row in orders}
+        self.assertEqual(summary[order.pk]['item_count'], 3)
+        self.assertEqual(summary[order.pk]['items_total'], '120.00')
+        self.assertNotIn('items', summary[order.pk])
+        self.assertEqual(len(orders), 2)
+        self.assertEqual(queries, 2)
+
+    def test_only_own_orders_are_listed(self):
+        other = User.objects.create_user('other', password='pass')
+        self.place_order([1], user=other)
+        mine = self.place_order([1])
+        _, orders = self.count_list_queries()
+        self.assertEqual([row['id'] for row in orders], [mine.pk])
+        self.assertEqual(APIClient().get('/api/orders/').status_code, 401)
+
+class AddItemStockTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = create_product('Runner', sizes=(('US 9', 'M', 2),))
+        self.size = self.product.sizes.get()
+        self.order = Order.objects.create(user=self.user, shipping_address='1 Main St', total_amount=0)
+
+    def add_item(self, **data):
+        return self.client.post(f'/api/orders/{self.order.pk}/add_item/', data, format='json')
+
+    def test_add_item_reserves_stock(self):
+        response = self.add_item(product=self.product.pk, size=self.size.pk, quantity=2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['price'], '100.00')
+        self.size.refresh_from_db()
+        self.assertEqual(self.size.quantity, 0)
+
+    def test_insufficient_stock_is_a_conflict(self):
+        response = self.add_item(size=self.size.pk, quantity=3)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_size_must_belong_to_product(self):
+        other = create_product('Trainer')
+        response = self.add_item(product=other.pk, size=self.size.pk)
+        self.assertEqual(response.status_code, 400)
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.sizes = [
+            create_product(f'Runner {i}', price=f'{10 * (i + 1)}.00', sizes=(('US 9', 'M', 3),)).sizes.get()
+            for i in range(5)
+        ]
+
+    def checkout(self, lines):
+        return self.client.post('/api/orders/checkout/', {
+            'shipping_address': '1 Main St',
+            'items': [{'size': size.pk, 'quantity': quantity} for size, quantity in lines],
+        }, format='json')
+
+    def test_checkout_places_cart_with_server_side_total(self):
+        response = self.checkout([(self.sizes[0], 2), (self.sizes[1], 1), (self.sizes[0], 1)])
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, 50)
+        self.assertEqual(
+            sorted(order.items.values_list('size_id', 'quantity')),
+            [(self.sizes[0].pk, 3), (self.sizes[1].pk, 1)],
+        )
+        self.assertEqual(Size.objects.get(pk=self.sizes[0].pk).quantity, 0)
+
+    def test_short_line_rejects_whole_cart(self):
+        response = self.checkout([(self.sizes[0], 1), (self.sizes[1], 4)])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['sizes'], [self.sizes[1].pk])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Size.objects.get(pk=self.sizes[0].pk).quantity, 3)
+
+    def test_query_count_is_independent_of_cart_size(self):
+        with CaptureQueriesContext(connection) as single:
+            self.checkout([(self.sizes[0], 1)])
+        with CaptureQueriesContext(connection) as full:
+            self.checkout([(size, 1) for size in self.sizes])
+        self.assertEqual(len(single), len(full))
+
+class OrderTotalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.size = create_product('Runner', price='40.00', sizes=(('US 9', 'M', 5),)).sizes.get()
+
+    def test_client_cannot_set_the_total(self):
+        response = self.client.post('/api/orders/', {
+            'shipping_address': '1 Main St', 'total_amount': '1.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual((order.user, order.total_amount), (self.user, 0))
+
+    def test_total_follows_added_and_removed_items(self):
+        order = Order.objects.create(user=self.user, shipping_address='1 Main St')
+        url = f'/api/orders/{order.pk}/'
+        self.client.post(f'{url}add_item/', {'size': self.size.pk, 'quantity': 2}, format='json')
+        item = self.client.post(f'{url}add_item/', {'size': self.size.pk}, format='json').json()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, 120)
+
+        response = self.client.post(f'{url}remove_item/', {'item': item['id']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_amount'], '80.00')
+        self.assertEqual(Size.objects.get(pk=self.size.pk).quantity, 3)
+
+    def test_double_removal_returns_stock_and_total_once(self):
+        order = Order.objects.create(user=self.user, shipping_address='1 Main St')
+        url = f'/api/orders/{order.pk}/'
+        item = self.client.post(f'{url}add_item/', {'size': self.size.pk}, format='json').json()
+        loaded = OrderItem.objects.get(pk=item['id'])
+
+        self.assertEqual(self.client.post(f'{url}remove_item/', {'item': item['id']}, format='json').status_code, 200)
+        # A second request that loaded the line before the first deleted it
+        self.assertFalse(order_totals.remove_item(loaded))
+        self.assertEqual(self.client.post(f'{url}remove_item/', {'item': item['id']}, format='json').status_code, 404)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, 0)
+        self.assertEqual(Size.objects.get(pk=self.size.pk).quantity, 5)
+
+    def test_reconcile_orders_reports_and_fixes_mismatches(self):
+        good = Order.objects.create(user=self.user, shipping_address='1 Main St', total_amount='40.00')
+        OrderItem.objects.create(order=good, product=self.size.product, size=self.size, price='40.00')
+        bad = Order.objects.create(user=self.user, shipping_address='1 Main St', total_amount='99.00')
+        OrderItem.objects.create(order=bad, product=self.size.product, size=self.size, quantity=2, price='40.00')
+        Order.objects.create(user=self.user, shipping_address='1 Main St', total_amount='5.00')
+
+        out = StringIO()
+        call_command('reconcile_orders', batch_size=2, stdout=out)
+        self.assertIn('Checked 3 orders, 2 mismatched', out.getvalue())
+        self.assertEqual(Order.objects.get(pk=bad.pk).total_amount, 99)
+
+        call_command('reconcile_orders', fix=True, stdout=StringIO())
+        self.assertEqual(Order.objects.get(pk=bad.pk).total_amount, 80)
+        self.assertEqual(set(Order.objects.values_list('total_amount', flat=True)), {0, 40, 80})
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', email='buyer@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.size = create_product('Runner', sizes=(('US 9', 'M', 5),)).sizes.get()
+        patcher = mock.patch.dict(jobs._tasks)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checkout(self, quantity):
+        return self.client.post('/api/orders/checkout/', {
+            'shipping_address': '1 Main St', 'items': [{'size': self.size.pk, 'quantity': quantity}],
+        }, format='json')
+
+    def run_due_jobs(self):
+        while (job := jobs.claim('test')) is not None:
+            jobs.run_job(job)
+
+    def test_checkout_queues_jobs_that_the_worker_runs(self):
+        self.assertEqual(self.checkout(4).status_code, 201)
+        self.assertEqual(
+            sorted(Job.objects.values_list('task', flat=True)), ['orders.send_confirmation', 'stock.low_stock_alert']
+        )
+        self.assertEqual(mail.outbox, [])
+        self.run_due_jobs()
+        self.assertEqual(set(Job.objects.values_list('status', flat=True)), {Job.DONE})
+        order = Order.objects.get()
+        self.assertEqual([message.subject for message in mail.outbox], [f'Order #{order.pk} confirmed'])
+        self.assertIn('Total: $400.00', mail.outbox[0].body)
+
+    def test_low_stock_alert_is_queued_once_when_crossing_the_threshold(self):
+        for quantity in (2, 1, 1, 1):
+            self.assertEqual(self.checkout(quantity).status_code, 201)
+        self.assertEqual(Job.objects.filter(task='stock.low_stock_alert').count(), 1)
+
+    def test_rejected_checkout_queues_nothing(self):
+        self.assertEqual(self.checkout(6).status_code, 409)
+        self.assertFalse(Job.objects.exists())
+
+    def test_idempotency_key_queues_once(self):
+        jobs.task('tests.noop')(lambda: None)
+        jobs.enqueue('tests.noop', key='once')
+        jobs.enqueue('tests.noop', key='once')
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        jobs.task('tests.broken', max_attempts=2)(mock.Mock(side_effect=ValueError('boom')))
+        jobs.enqueue('tests.broken')
+        self.run_due_jobs()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('ValueError: boom', job.last_error)
+
+        Job.objects.update(run_at=timezone.now())
+        self.run_due_jobs()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_abandoned_job_is_claimed_again_after_its_lease(self):
+        jobs.task('tests.noop')(lambda: None)
+        jobs.enqueue('tests.noop')
+        abandoned = jobs.claim('dead worker')
+        self.assertIsNone(jobs.claim('test'))
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=jobs.DEFAULT_LEASE + 1))
+        self.assertTrue(jobs.run_job(jobs.claim('test')))
+        # The first claim no longer owns the job, so its outcome is not recorded
+        self.assertFalse(jobs._finish(abandoned, status=Job.FAILED))
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+class RunWorkerTests(TransactionTestCase):
+    def test_each_job_runs_once_across_worker_threads(self):
+        ran = []
+        with mock.patch.dict(jobs._tasks):
+            jobs.task('tests.record')(lambda number: ran.append(number))
+            for number in range(20):
+                jobs.enqueue('tests.record', {'number': number})
+            call_command('run_worker', concurrency=4, burst=True, stdout=StringIO())
+        self.assertEqual(sorted(ran), list(range(20)))
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 20)
+
+class ConcurrentAddItemTests(TransactionTestCase):
+    def test_concurrent_checkouts_never_oversell(self):
+        stock, buyers = 10, 25
+        user = User.objects.create_user('buyer', password='pass')
+        size = create_product('Runner', sizes=(('US 9', 'M', stock),)).sizes.get()
+        order = Order.objects.create(user=user, shipping_address='1 Main St', total_amount=0)
+
+        barrier = threading.Barrier(buyers)
+        statuses = []
+
+        def buy():
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                response = client.post(
+                    f'/api/orders/{order.pk}/add_item/', {'size': size.pk}, format='json'
+                )
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(buyers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        size.refresh_from_db()
+        self.assertEqual(size.quantity, 0)
+        self.assertEqual(OrderItem.objects.count(), stock)
+        self.assertEqual(statuses.count(201), stock)
+        self.assertEqual(statuses.count(409), buyers - stock)
+
+class RequestLoggingMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    @override_settings(REQUEST_LOGGING={'SAMPLE_RATE': 1, 'LOG_BODIES': True, 'MAX_BODY_BYTES': 10})
+    def test_sampled_request_is_logged_with_truncated_body(self):
+        with self.assertLogs('store.requests', 'INFO') as logs:
+            self.client.get('/api/categories/')
+        fields = logs.records[0].request_log
+        self.assertEqual(fields['status'], 200)
+        self.assertTrue(str(fields['response_body']).endswith('more bytes]'))
+
+    @override_settings(REQUEST_LOGGING={'SAMPLE_RATE': 1, 'LOG_BODIES': True})
+    def test_shipped_formatter_renders_the_request_fields(self):
+        with self.assertLogs('store.requests', 'INFO') as logs:
+            self.client.post('/api/categories/', {'name': 'Trail'}, format='json')
+        verbose = settings.LOGGING['formatters']['verbose']
+        line = logging.Formatter(verbose['format'], style=verbose['style']).format(logs.records[0])
+        fields = json.loads(line[line.index('{'):])
+        self.assertEqual((fields['method'], fields['path']), ('POST', '/api/categories/'))
+        self.assertEqual(fields['request_body'], '{"name":"Trail"}')
+        self.assertEqual(fields['status'], 401)
+
+    @override_settings(REQUEST_LOGGING={'SAMPLE_RATE': 1, 'ROUTES': ['/api/orders/']})
+    def test_routes_outside_the_enable_list_are_skipped(self):
+        with self.assertNoLogs('store.requests', 'INFO'):
+            self.client.get('/api/categories/')
+
+class QueueLogHandlerTests(TestCase):
+    def test_full_queue_drops_oldest_records(self):
+        release, handled = threading.Event(), []
+
+        class SlowHandler(logging.Handler):
+            def emit(self, record):
+                release.wait()
+                handled.append(record.getMessage())
+
+        target = SlowHandler()
+        target.name = 'slow-test-target'
+        handler = QueueLogHandler(handlers=[target.name], maxsize=2)
+        logger = logging.getLogger('store.tests.queue')
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            for i in range(6):
+                logger.warning('record %s', i)
+        finally:
+            release.set()
+            logger.removeHandler(handler)
+            handler.close()
+
+        self.assertEqual(handled[-2:], ['record 4', 'record 5'])
+        self.assertEqual(handler.dropped, 6 - len(handled))
+
+    def test_file_handler_creates_its_directory_on_first_write(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'logs', 'django.log')
+            handler = LazyFileHandler(path, delay=True)
+            self.assertFalse(os.path.exists(os.path.dirname(path)))
+            handler.emit(logging.makeLogRecord({'msg': 'hello'}))
+            handler.close()
+            with open(path) as f:
+                self.assertEqual(f.read(), 'hello\n')
+
+            blocked = os.path.join(tmp, 'file')
+            open(blocked, 'w').close()
+            handler = LazyFileHandler(os.path.join(blocked, 'django.log'), delay=True)
+            handler.emit(logging.makeLogRecord({'msg': 'dropped'}))
+            self.assertTrue(handler.unavailable)
@@ -0,0 +1,146 @@
+import hashlib
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import permissions
+from rest_framework.response import Response
+from store import cache as catalog_cache
+from store.db_router import is_pinned_to_primary, pin_to_primary, replica_reads
+
+class CatalogCacheMixin:
+    """
+    Serve list and retrieve responses from the versioned catalog cache.
+
+    `cache_models` names every model the response is built from; saving or
+    deleting any of them invalidates the cached pages.
+    """
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(super().retrieve, request, *args, **kwargs)
+
+    def _cached_response(self, view, request, *args, **kwargs):
+        key = catalog_cache.response_key(self.cache_models, request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not catalog_cache.replica_may_be_stale():
+            cache.set(key, response.data, catalog_cache.get_timeout())
+        return response
+
+class ConditionalGetMixin:
+    """
+    Answer list and retrieve requests with 304 Not Modified when the client
+    already holds the current representation.
+
+    The validator is derived from MAX(updated_at) and COUNT(*) over the
+    requested rows plus the catalog versions of `validator_models`, which
+    covers related rows whose changes do not touch updated_at. Nothing is
+    serialized to compute it, and it is memoized under the same versioned
+    keys as cached responses so repeat polls skip the database entirely.
+
+    Last-Modified is only sent when every validator model is the viewset's
+    own: changes to related rows (sizes, stock, categories) do not move
+    MAX(updated_at), so a client relying on If-Modified-Since alone would
+    keep getting 304 for a changed representation.
+    """
+    validator_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_response(
+            self.get_validator_queryset, super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            queryset = self.get_validator_queryset().filter(**lookup)
+        except (TypeError, ValueError, ValidationError):
+            # Not a valid key for the lookup field; the view answers 404
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional_response(lambda: queryset, super().retrieve, request, *args, **kwargs)
+
+    def get_validator_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def get_validators(self, request, get_queryset):
+        """Return the (etag, last_modified) pair for the requested rows"""
+        key = f'{catalog_cache.response_key(self.validator_models, request)}:validators'
+        validators = cache.get(key)
+        if validators is not None:
+            return validators
+
+        queryset = get_queryset()
+        stats = queryset.order_by().aggregate(
+            last_modified=Max('updated_at'), rows=Count('pk')
+        )
+        versions = [catalog_cache.get_version(name) for name in self.validator_models]
+        etag = quote_etag(hashlib.md5(
+            f"{request.get_full_path()}:{stats['last_modified']}:{stats['rows']}:{versions}".encode()
+        ).hexdigest())
+        last_modified = None
+        if stats['last_modified'] and set(self.validator_models) <= {queryset.model._meta.model_name}:
+            # HTTP dates have one-second resolution
+            last_modified = int(stats['last_modified'].timestamp())
+
+        validators = (etag, last_modified)
+        if not catalog_cache.replica_may_be_stale():
+            cache.set(key, validators, catalog_cache.get_timeout())
+        return validators
+
+    def _conditional_response(self, get_queryset, view, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, get_queryset)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+class ListSerializerMixin:
+    """
+    Serialize list responses with `list_serializer_class`, a read-only fast
+    path with the same output; every other action, and the browsable API's
+    forms, keep `serializer_class`.
+    """
+    list_serializer_class = None
+
+    def get_serializer_class(self):
+        if (self.list_serializer_class is not None and self.action == 'list'
+                and self.request.method in ('GET', 'HEAD')):
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+class ReplicaReadMixin:
+    """
+    Serve safe (GET/HEAD/OPTIONS) requests from the read replica.
+
+    Unsafe requests run on the primary, and a successful one pins the user to
+    the primary for a short window so their next reads see what they wrote.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS and not is_pinned_to_primary(request.user):
+            self._replica_reads = replica_reads()
+            self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica = getattr(self, '_replica_reads', None)
+        if replica is not None:
+            self._replica_reads = None
+            replica.__exit__(None, None, None)
+        elif request.method not in permissions.SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,7 +1,143 @@
-from rest_framework import viewsets
-from store.models import Order
-from store.serializers.order_serializer import OrderSerializer
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from store import jobs, order_totals
+from store.inventory import InsufficientStock, release_stock, reserve_stock, reserve_stock_bulk
+from store.models import Order, OrderItem, Size
+from store.serializers.order_serializer import (
+    AddItemSerializer, CheckoutSerializer, OrderItemSerializer, OrderListSerializer, OrderSerializer,
+    OrderSummarySerializer, RemoveItemSerializer
+)
+from store.views.mixins import ListSerializerMixin, ReplicaReadMixin
+import logging
 
-class OrderViewSet(viewsets.ModelViewSet):
+logger = logging.getLogger(__name__)
+
+class OrderViewSet(ReplicaReadMixin, ListSerializerMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    list_serializer_class = OrderListSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def is_summary(self):
+        """`?view=summary` lists orders with item aggregates instead of the items"""
+        return self.action == 'list' and self.request.query_params.get('view') == 'summary'
+
+    def get_queryset(self):
+        """
+        The user's own orders, newest first (backed by order_user_created_idx),
+        with their items loaded in a fixed number of queries
+        """
+        orders = Order.objects.filter(user=self.request.user)
+        if self.is_summary():
+            # Meta.ordering does not apply to aggregate queries
+            return orders.with_summary().order_by('-created_at', '-pk')
+        return orders.with_items()
+
+    def get_serializer_class(self):
+        if self.is_summary():
+            return OrderSummarySerializer
+        return super().get_serializer_class()
+
+    def perform_create(self, serializer):
+        # The total starts at zero and follows the items added
+        serializer.save(user=self.request.user)
+
+    @action(detail=True, methods=['post'])
+    def add_item(self, request, pk=None):
+        """Reserve stock for a size and add it to the order and its total in one transaction"""
+        order = get_object_or_404(Order, pk=pk, user=request.user)
+        serializer = AddItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        size = serializer.validated_data['size']
+        quantity = serializer.validated_data['quantity']
+
+        try:
+            with transaction.atomic():
+                reserve_stock(size.pk, quantity)
+                [item] = order_totals.add_items(order, [
+                    OrderItem(product=size.product, size=size, quantity=quantity, price=size.product.price)
+                ])
+        except InsufficientStock:
+            logger.info(f"Insufficient stock for size {size.pk} - Requested: {quantity}")
+            return Response(
+                {"error": "Not enough stock available"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(OrderItemSerializer(item).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def remove_item(self, request, pk=None):
+        """Delete an order line, return its stock and take it off the total in one transaction"""
+        order = get_object_or_404(Order, pk=pk, user=request.user)
+        serializer = RemoveItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        item = get_object_or_404(OrderItem, pk=serializer.validated_data['item'], order=order)
+
+        with transaction.atomic():
+            if not order_totals.remove_item(item):
+                # Removed by a concurrent request, which returned the stock
+                raise Http404
+            release_stock(item.size_id, item.quantity)
+
+        return Response(OrderSerializer(self.get_queryset().get(pk=order.pk)).data)
+
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        """
+        Place a whole cart as one order.
+
+        The statement count is fixed whatever the cart size. Before the
+        transaction, one read for sizes and prices. Inside it, one UPDATE
+        reserving every line (in a savepoint), one read of the reserved
+        sizes' remaining stock, one order insert, one bulk insert of the
+        items, one UPDATE of the total, one insert queueing the confirmation
+        email (store.tasks) and, when a size drops to LOW_STOCK_THRESHOLD,
+        one insert queueing the low-stock alert. On SQLite the products'
+        availability summaries are refreshed in the transaction too (a
+        locking read of the products, a read of their sizes and one bulk
+        UPDATE); other backends run that refresh after the commit (see
+        store.inventory). The response reads the order back with its items
+        in three more.
+        """
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quantities = serializer.validated_data['items']
+
+        sizes = Size.objects.select_related('product').in_bulk(list(quantities))
+        missing = sorted(set(quantities) - set(sizes))
+        if missing:
+            return Response(
+                {"error": "Unknown sizes", "sizes": missing},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        items = [
+            OrderItem(product=size.product, size=size, quantity=quantities[size_id], price=size.product.price)
+            for size_id, size in sizes.items()
+        ]
+        try:
+            with transaction.atomic():
+                reserve_stock_bulk(quantities)
+                order = Order.objects.create(
+                    user=request.user,
+                    shipping_address=serializer.validated_data['shipping_address'],
+                )
+                order_totals.add_items(order, items)
+                jobs.enqueue(
+                    'orders.send_confirmation', {'order_id': order.pk}, key=f'order-confirmation:{order.pk}'
+                )
+        except InsufficientStock as e:
+            logger.info(f"Checkout rejected - Insufficient stock: {e.shortages}")
+            return Response(
+                {"error": "Not enough stock available", "sizes": sorted(e.shortages)},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(
+            OrderSerializer(self.get_queryset().get(pk=order.pk)).data, status=status.HTTP_201_CREATED
+        )
@@ -1,11 +1,139 @@
-from rest_framework import viewsets
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.cache import patch_cache_control
+from django.db import transaction
+from rest_framework import filters, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.exceptions import NotFound
+from store import cache as catalog_cache
+from store import filter_index
+from store.export import iter_export
+from store.facets import CatalogFilter, facet_counts
 from store.models import Category, Product
-from store.serializers.product_serializer import CategorySerializer, ProductSerializer
+from store.pagination import ProductCursorPagination
+from store.search import ProductSearchFilter, suggest_products
+from store.serializers.product_serializer import (
+    CategorySerializer, ProductListSerializer, ProductSerializer
+)
+from store.views.mixins import (
+    CatalogCacheMixin, ConditionalGetMixin, ListSerializerMixin, ReplicaReadMixin
+)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, ConditionalGetMixin, CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_models = ('category',)
+    validator_models = ('category',)
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, ConditionalGetMixin, CatalogCacheMixin, ListSerializerMixin,
+                     viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    list_serializer_class = ProductListSerializer
+    filter_backends = [ProductSearchFilter, CatalogFilter, filters.OrderingFilter]
+    ordering_fields = ['price', 'created_at', 'rating']
+    cache_models = ('product', 'size', 'category')
+    validator_models = ('product', 'size', 'category')
+
+    @property
+    def paginator(self):
+        """
+        Page numbers by default; `?paginate=cursor` (or following a cursor
+        link) switches to keyset pagination, which skips the COUNT(*) and
+        OFFSET scans of deep pages.
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('paginate') == 'cursor' or 'cursor' in params:
+                self._paginator = ProductCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_queryset(self):
+        """
+        Category, sizes and stock totals are loaded up front so a page
+        costs the same number of queries regardless of its length.
+        """
+        # Tie-break on id so pages stay stable between requests
+        return Product.objects.with_catalog_data().order_by('name', 'id')
+
+    def get_validator_queryset(self):
+        # The plain table is enough to detect changes; skip the joins and aggregates
+        return self.filter_queryset(Product.objects.all())
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Top brand and name completions for `?q=`, for search-box type-ahead"""
+        try:
+            limit = min(int(request.query_params.get('limit', 8)), 20)
+        except ValueError:
+            limit = 8
+
+        key = catalog_cache.response_key(('product',), request)
+        suggestions = cache.get(key)
+        if suggestions is None:
+            suggestions = suggest_products(request.query_params.get('q', ''), max(limit, 1))
+            if not catalog_cache.replica_may_be_stale():
+                cache.set(key, suggestions, catalog_cache.get_timeout())
+
+        response = Response({'suggestions': suggestions})
+        patch_cache_control(response, public=True, max_age=60)
+        return response
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Product counts per category, brand, in-stock size and price band for
+        the current search and filters, for the filter sidebar
+        """
+        key = catalog_cache.response_key(self.cache_models, request)
+        data = cache.get(key)
+        if data is None:
+            products = ProductSearchFilter().filter_queryset(request, Product.objects.all(), self)
+            data = facet_counts(products, request.query_params)
+            if not catalog_cache.replica_may_be_stale():
+                cache.set(key, data, catalog_cache.get_timeout())
+
+        response = Response(data)
+        patch_cache_control(response, public=True, max_age=60)
+        return response
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """
+        Stream the whole catalog as NDJSON, one product per line, for the
+        search and ads feeds. Gzipped when the client accepts it.
+        """
+        gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        response = StreamingHttpResponse(iter_export(gzip=gzip), content_type='application/x-ndjson')
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response['Content-Disposition'] = 'attachment; filename="catalog.ndjson"'
+        return response
+
+    @action(detail=True, methods=['post'])
+    def rate_product(self, request, pk=None):
+        try:
+            rating = float(request.data.get('rating'))
+            if not (0 <= rating <= 5):
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "Rating must be a number between 0 and 5"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            if not Product.objects.filter(pk=pk).add_rating(rating):
+                raise NotFound()
+            transaction.on_commit(lambda: self._rating_changed(pk))
+        product = Product.objects.filter(pk=pk).values('rating', 'review_count').get()
+        return Response({"success": "Rating added successfully", **product})
+
+    def _rating_changed(self, pk):
+        version = catalog_cache.bump_version('product')
+        filter_index.catalog_changed('product', [pk], version)